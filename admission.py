@@ -0,0 +1,146 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import OrderedDict
+
+import metrics
+from clients import RateLimiter
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_SLO = float(os.getenv("ADMISSION_QUEUE_SLO", "10"))
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "0.5"))
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "5"))
+ADMISSION_RATE_KEY = os.getenv("ADMISSION_RATE_KEY", "session")
+
+BUSY_MESSAGES = {
+    "rate_limited": "You're sending messages faster than I can answer them. Please wait a moment and try again.",
+    "queue_full": "I'm helping a lot of travelers right now. Please try again in a moment.",
+    "queue_timeout": "I'm helping a lot of travelers right now. Please try again in a moment.",
+}
+
+
+class AdmissionController:
+    """
+    Decides whether a chat request runs now, waits, or is turned away.
+
+    At most `max_concurrent` requests run at once, which bounds the upstream
+    LLM and search calls in flight. Each client key (session or IP) has a token
+    bucket of `rate` requests per second with bursts of `burst`. Requests over
+    the cap wait in a queue of at most `max_queue`, lower `priority` first,
+    for up to `queue_slo` seconds. Requests that are over their rate, find
+    the queue full or wait past the SLO are rejected at once so the app can
+    answer "busy" instead of piling up.
+
+    Meant to be used from a single event loop, like Gradio's async handlers.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_slo=ADMISSION_QUEUE_SLO, rate=ADMISSION_RATE, burst=ADMISSION_BURST, max_clients=10000):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_slo = queue_slo
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._buckets = OrderedDict()
+
+    def _bucket(self, client_key):
+        bucket = self._buckets.get(client_key)
+        if bucket is None:
+            bucket = self._buckets[client_key] = RateLimiter(self.rate, self.burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(client_key)
+        return bucket
+
+    def _reject(self, reason):
+        ADMISSION_DECISIONS.inc(outcome=reason)
+        return reason
+
+    async def acquire(self, client_key, priority=0):
+        """
+        Waits for a slot. Returns None once admitted (call release() when done),
+        or the reason the request was rejected: "rate_limited", "queue_full" or
+        "queue_timeout".
+        """
+        if not self._bucket(client_key).try_acquire():
+            return self._reject("rate_limited")
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            ADMISSION_DECISIONS.inc(outcome="admitted")
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+            self._report()
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        self._report()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_slo)
+        except asyncio.TimeoutError:
+            return self._reject("queue_timeout")
+        except BaseException:
+            # Handed a slot just as the caller went away: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started)
+            self._prune()
+            self._report()
+        ADMISSION_DECISIONS.inc(outcome="admitted")
+        return None
+
+    def release(self):
+        # Hand the slot straight to the best waiter that is still waiting
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(True)
+                self._report()
+                return
+        self.active -= 1
+        self._report()
+
+    def _prune(self):
+        # Drop waiters that timed out or were cancelled
+        if any(waiter.done() for _, _, waiter in self._waiters):
+            self._waiters = [entry for entry in self._waiters if not entry[2].done()]
+            heapq.heapify(self._waiters)
+
+    @property
+    def queue_depth(self):
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    def _report(self):
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_QUEUE_DEPTH.set(self.queue_depth)
+
+
+def client_key(request, key_by=ADMISSION_RATE_KEY):
+    """The rate-limiting key of a Gradio request: its session, or with key_by="ip" its client address."""
+    if key_by == "ip":
+        forwarded = request.headers.get("x-forwarded-for") if request.headers else None
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+        return request.client.host if request.client else "unknown"
+    return request.session_hash
+
+
+ADMISSION_DECISIONS = metrics.Counter("travel_agent_admission_total",
+                                      "Admission decisions for chat requests, by outcome.")
+ADMISSION_WAIT_SECONDS = metrics.Histogram("travel_agent_admission_wait_seconds",
+                                           "Time chat requests spent queued for admission in seconds.")
+ADMISSION_QUEUE_DEPTH = metrics.Gauge("travel_agent_admission_queue_depth",
+                                      "Chat requests waiting for admission.")
+ADMISSION_ACTIVE = metrics.Gauge("travel_agent_admission_active",
+                                 "Chat requests admitted and running.")
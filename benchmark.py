@@ -0,0 +1,144 @@
+import argparse
+import csv
+import json
+import os
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# Benchmarks measure the agent, not the exporter; keys only need to be non-empty offline
+os.environ.setdefault("TRACING_ENABLED", "false")
+os.environ.setdefault("OPENAI_API_KEY", "offline")
+os.environ.setdefault("SERPER_API_KEY", "offline")
+
+import replay
+
+
+def load_questions(path, limit=None):
+    with open(path, newline="") as f:
+        return [row["questions"] for row in csv.DictReader(f)][:limit]
+
+
+def parse_latency(items):
+    # ["openai=0.8", "serpapi=1.5"] -> {"openai": 0.8, "serpapi": 1.5}
+    latency = {}
+    for item in items or []:
+        name, seconds = item.split("=", 1)
+        latency[name.strip()] = float(seconds)
+    return latency
+
+
+def reset_caches():
+    import tools
+
+    tools.flight_cache.backend.clear()
+    tools.tool_result_cache.cache.backend.clear()
+
+
+def run_session(questions):
+    """Runs one conversation and returns the bot and per-turn latencies."""
+    from main import TravelAgentBot
+
+    travel_bot = TravelAgentBot()
+    latencies, errors = [], 0
+    for question in questions:
+        started = time.perf_counter()
+        try:
+            travel_bot.respond(question)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    return travel_bot, latencies, errors
+
+
+def conversations(questions, sessions, turns):
+    # Session i asks questions i, i+1, ... so every level sees the same mix
+    return [[questions[(i + t) % len(questions)] for t in range(turns)] for i in range(sessions)]
+
+
+def run_level(questions, concurrency, sessions, turns):
+    """Runs `sessions` conversations on `concurrency` threads; returns throughput and latency percentiles."""
+    from run_hard_questions import summarize_latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(run_session, conversations(questions, sessions, turns)))
+    wall_time = time.perf_counter() - started
+
+    latencies = [latency for _, session_latencies, _ in outcomes for latency in session_latencies]
+    summary = summarize_latencies(latencies, wall_time)
+    summary.update(concurrency=concurrency, sessions=sessions, errors=sum(errors for _, _, errors in outcomes),
+                   wall_time_s=wall_time)
+    return summary
+
+
+def measure_session_memory(questions, sessions, turns):
+    """Average bytes still allocated per finished conversation, traced with tracemalloc."""
+    from sessions import history_size
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        bots = [run_session(conversation)[0] for conversation in conversations(questions, sessions, turns)]
+        allocated = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return {
+        "sessions": len(bots),
+        "bytes_per_session": allocated / len(bots),
+        "history_chars_per_session": sum(history_size(bot) for bot in bots) / len(bots),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark TravelAgentBot.respond offline against recorded or stand-in upstreams."
+    )
+    parser.add_argument("--questions", default="generated_questions/test_hard_agent_questions.csv")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--sessions-per-worker", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=2, help="Questions asked per conversation")
+    parser.add_argument("--recordings", help="Replay responses recorded with --record")
+    parser.add_argument("--record", help="Call the live services and record their responses to this JSONL file")
+    parser.add_argument("--latency", nargs="*", metavar="UPSTREAM=SECONDS",
+                        help="Synthetic latency per upstream (openai, serpapi, phoenix)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Scales recorded latencies")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--warm-caches", action="store_true", help="Keep tool caches between levels")
+    parser.add_argument("--memory-sessions", type=int, default=20)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.record:
+        replay.record(args.record)
+    else:
+        transport = replay.replay(args.recordings, latency=parse_latency(args.latency),
+                                  latency_scale=args.latency_scale, jitter=args.jitter)
+    # Start-up work deferred from import is not part of any request
+    from main import warm_up
+
+    warm_up()
+
+    questions = load_questions(args.questions, args.limit)
+    results = {"levels": []}
+    for concurrency in args.concurrency:
+        if not args.warm_caches:
+            reset_caches()
+        summary = run_level(questions, concurrency, concurrency * args.sessions_per_worker, args.turns)
+        results["levels"].append(summary)
+        print(f"concurrency={concurrency:<3} {summary['questions_per_second']:7.2f} req/s  "
+              f"p50={summary['p50']:.3f}s p95={summary['p95']:.3f}s p99={summary['p99']:.3f}s  "
+              f"errors={summary['errors']}")
+
+    if args.memory_sessions:
+        reset_caches()
+        results["memory"] = measure_session_memory(questions, args.memory_sessions, args.turns)
+        print(f"memory: {results['memory']['bytes_per_session'] / 1024:.1f} KiB per session")
+    if not args.record:
+        results["replay"] = {"hits": transport.hits, "misses": transport.misses}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    """
+    Thread-safe in-memory LRU store of (value, stored_at) pairs.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    SQLite-backed store so cached responses survive restarts and can be shared
+    by worker processes on one host. Values must be JSON-serializable.
+    """
+
+    def __init__(self, path, table="cache", max_entries=None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), stored_at),
+            )
+            if self.max_entries:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key NOT IN "
+                    f"(SELECT key FROM {self.table} ORDER BY stored_at DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def make_backend(path=None, table="cache", max_entries=1024):
+    """SQLite backend when a path is configured, in-memory LRU otherwise."""
+    if path:
+        return SQLiteBackend(path, table=table, max_entries=max_entries)
+    return MemoryBackend(max_entries=max_entries)
+
+
+class ResponseCache:
+    """
+    TTL cache with stale-while-revalidate over a pluggable backend.
+
+    Entries younger than `ttl` seconds are fresh hits. Entries up to
+    `ttl + stale_ttl` seconds old are returned immediately while a background
+    thread recomputes them. Anything older is recomputed inline.
+    """
+
+    def __init__(self, backend=None, ttl=300, stale_ttl=0, name="cache"):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value if it is fresh or within the stale window, else None."""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.time() - stored_at > self.ttl + self.stale_ttl:
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Stores `value`; a `ttl` shorter than the cache's makes this entry expire sooner."""
+        stored_at = time.time()
+        if ttl is not None:
+            stored_at -= max(0, self.ttl - ttl)
+        self.backend.set(key, value, stored_at)
+
+    def get_or_compute(self, key, compute, should_cache=None):
+        """
+        Returns the cached value for `key`, calling `compute()` on a miss. Results for
+        which `should_cache(result)` is false (e.g. upstream errors) are not stored.
+        """
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age <= self.ttl:
+                self._count("hits")
+                return value
+            if age <= self.ttl + self.stale_ttl:
+                self._count("stale_hits")
+                self._revalidate(key, compute, should_cache)
+                return value
+
+        self._count("misses")
+        value = compute()
+        if should_cache is None or should_cache(value):
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "entries": len(self.backend),
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _revalidate(self, key, compute, should_cache):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                value = compute()
+                if should_cache is None or should_cache(value):
+                    self.set(key, value)
+            except Exception:
+                # Keep serving the stale value; the next lookup retries.
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
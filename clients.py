@@ -0,0 +1,374 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+PHOENIX_TIMEOUT = float(os.getenv("PHOENIX_TIMEOUT", "10"))
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+SERPAPI_RATE_LIMIT = float(os.getenv("SERPAPI_RATE_LIMIT", "5"))
+SERPAPI_RATE_BURST = int(os.getenv("SERPAPI_RATE_BURST", "5"))
+
+SERPAPI_URL = "https://serpapi.com/search.json"
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails calls fast
+    for `reset_timeout` seconds. After that one trial call is let through; its
+    outcome closes the circuit or opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        # The trial call ended without an outcome (e.g. it was cancelled); let the next call try
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+breakers = {name: CircuitBreaker(name) for name in ("openai", "phoenix", "serpapi")}
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` calls per second on average and bursts of up
+    to `burst` calls. A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _reserve(self):
+        # Takes a token, possibly going into debt; returns how long to wait for it
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        """Blocks until a call is allowed."""
+        if self.rate > 0:
+            time.sleep(self._reserve())
+
+    def try_acquire(self):
+        """Takes a call if one is allowed right now; never waits."""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+# SerpAPI bills per search and rejects bursts, so fan-outs are paced here
+serpapi_rate_limiter = RateLimiter(SERPAPI_RATE_LIMIT, SERPAPI_RATE_BURST)
+
+
+def _backoff(attempt, base=0.5, cap=8.0):
+    # Full jitter
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _is_retryable(response):
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def _is_final_attempt(request, attempt, retries, caller_retries):
+    # The OpenAI SDK counts its own retries in x-stainless-retry-count
+    caller_attempt = int(request.headers.get("x-stainless-retry-count", caller_retries))
+    return attempt == retries and caller_attempt >= caller_retries
+
+
+def _report(breaker, status, final):
+    """
+    Reports one attempt to the circuit breaker. Only 5xx responses and transport
+    errors (status None) count as failures, and only on a request's final attempt,
+    so a request counts once however often it is retried. A 429 means the upstream
+    is up but throttling us, so it doesn't count either way.
+    """
+    if status is not None and status < 500 and status != 429:
+        breaker.record_success()
+    elif final and status != 429:
+        breaker.record_failure()
+    else:
+        # No outcome yet: a half-open trial passes to the next attempt
+        breaker.release_trial()
+
+
+def _circuit_open_response(request, breaker):
+    # x-should-retry tells the OpenAI SDK not to retry on top of us
+    return httpx.Response(
+        503,
+        headers={"x-should-retry": "false"},
+        json={"error": f"{breaker.name} circuit breaker is open"},
+        request=request,
+    )
+
+
+class ResilientTransport(httpx.HTTPTransport):
+    """
+    Pooled transport that retries 429/5xx responses and connection errors with
+    jittered backoff and reports outcomes to the upstream's circuit breaker.
+    `caller_retries` is how often the client retries on top of the transport
+    (the OpenAI SDK's max_retries), so a request is reported once either way.
+    """
+
+    def __init__(self, breaker, retries=HTTP_RETRIES, caller_retries=0, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+        self.retries = retries
+        self.caller_retries = caller_retries
+
+    def handle_request(self, request):
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                return _circuit_open_response(request, self.breaker)
+            final = _is_final_attempt(request, attempt, self.retries, self.caller_retries)
+            try:
+                response = super().handle_request(request)
+            except httpx.TransportError:
+                _report(self.breaker, None, final)
+                if attempt == self.retries:
+                    raise
+                time.sleep(_backoff(attempt))
+                continue
+            except BaseException:
+                # Cancelled or interrupted: a half-open trial must not hold the circuit shut
+                self.breaker.release_trial()
+                raise
+            _report(self.breaker, response.status_code, final)
+            if not _is_retryable(response) or attempt == self.retries:
+                return response
+            response.close()
+            time.sleep(_backoff(attempt))
+
+
+class AsyncResilientTransport(httpx.AsyncHTTPTransport):
+    """
+    Async variant of ResilientTransport.
+    """
+
+    def __init__(self, breaker, retries=HTTP_RETRIES, caller_retries=0, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+        self.retries = retries
+        self.caller_retries = caller_retries
+
+    async def handle_async_request(self, request):
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                return _circuit_open_response(request, self.breaker)
+            final = _is_final_attempt(request, attempt, self.retries, self.caller_retries)
+            try:
+                response = await super().handle_async_request(request)
+            except httpx.TransportError:
+                _report(self.breaker, None, final)
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+                continue
+            except BaseException:
+                # Cancelled or interrupted: a half-open trial must not hold the circuit shut
+                self.breaker.release_trial()
+                raise
+            _report(self.breaker, response.status_code, final)
+            if not _is_retryable(response) or attempt == self.retries:
+                return response
+            await response.aclose()
+            await asyncio.sleep(_backoff(attempt))
+
+
+# Test hooks: set_client replaces a client outright, set_transport routes every
+# client built afterwards through e.g. httpx.MockTransport.
+_clients = {}
+_overrides = {}
+_transport = None
+_lock = threading.Lock()
+
+
+def set_client(name, client):
+    _overrides[name] = client
+
+
+def set_transport(transport):
+    global _transport
+    _transport = transport
+    reset_clients()
+
+
+def reset_clients():
+    with _lock:
+        _clients.clear()
+
+
+def _limits():
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+
+
+def _http_client(upstream, timeout, retries=HTTP_RETRIES, caller_retries=0, **kwargs):
+    transport = _transport or ResilientTransport(breakers[upstream], retries=retries, caller_retries=caller_retries,
+                                                 limits=_limits())
+    return httpx.Client(transport=transport, timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT), **kwargs)
+
+
+def _async_http_client(upstream, timeout, retries=HTTP_RETRIES, caller_retries=0, **kwargs):
+    transport = _transport or AsyncResilientTransport(breakers[upstream], retries=retries,
+                                                      caller_retries=caller_retries, limits=_limits())
+    return httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT), **kwargs)
+
+
+def _get(name, factory):
+    if name in _overrides:
+        return _overrides[name]
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def openai_client():
+    # Imported on first use: the SDK takes longer to import than the rest of the app without Gradio
+    import openai
+
+    # The SDK retries 429/5xx itself, so the transport only adds the circuit breaker
+    return _get("openai", lambda: openai.OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_retries=OPENAI_MAX_RETRIES,
+        http_client=_http_client("openai", OPENAI_TIMEOUT, retries=0, caller_retries=OPENAI_MAX_RETRIES),
+    ))
+
+
+def async_openai_client():
+    import openai
+
+    return _get("async_openai", lambda: openai.AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_retries=OPENAI_MAX_RETRIES,
+        http_client=_async_http_client("openai", OPENAI_TIMEOUT, retries=0, caller_retries=OPENAI_MAX_RETRIES),
+    ))
+
+
+def _phoenix_base_url():
+    endpoint = os.getenv("PHOENIX_COLLECTOR_ENDPOINT")
+    if endpoint:
+        return endpoint.rstrip("/")
+    return f"http://{os.getenv('PHOENIX_HOST', '127.0.0.1')}:{os.getenv('PHOENIX_PORT', '6006')}"
+
+
+def _phoenix_headers():
+    # Same environment variables the Phoenix client reads on its own
+    headers = {}
+    for item in os.getenv("PHOENIX_CLIENT_HEADERS", "").split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            if key.strip() and value.strip():
+                headers[key.strip()] = value.strip()
+    if os.getenv("PHOENIX_API_KEY"):
+        headers["Authorization"] = f"Bearer {os.getenv('PHOENIX_API_KEY')}"
+    return headers
+
+
+def phoenix_client():
+    from phoenix.client import Client
+
+    return _get("phoenix", lambda: Client(http_client=_http_client(
+        "phoenix", PHOENIX_TIMEOUT, base_url=_phoenix_base_url(), headers=_phoenix_headers()
+    )))
+
+
+def async_phoenix_client():
+    from phoenix.client import AsyncClient
+
+    return _get("async_phoenix", lambda: AsyncClient(http_client=_async_http_client(
+        "phoenix", PHOENIX_TIMEOUT, base_url=_phoenix_base_url(), headers=_phoenix_headers()
+    )))
+
+
+def serpapi_client():
+    return _get("serpapi", lambda: _http_client("serpapi", SERPAPI_TIMEOUT))
+
+
+def serpapi_search(params):
+    """
+    Runs a SerpAPI search over the pooled client and returns the decoded JSON,
+    like serpapi.GoogleSearch(params).get_dict(). Calls are paced by
+    serpapi_rate_limiter. Failures are reported through the "error" key, as
+    SerpAPI itself does.
+    """
+    serpapi_rate_limiter.acquire()
+    try:
+        response = serpapi_client().get(SERPAPI_URL, params={
+            **{key: value for key, value in params.items() if value is not None}, "output": "json"
+        })
+    except httpx.HTTPError as e:
+        return {"error": f"SerpAPI request failed: {e}"}
+    try:
+        return response.json()
+    except ValueError:
+        return {"error": f"SerpAPI returned HTTP {response.status_code}"}
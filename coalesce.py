@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import metrics
+from tool_cache import normalize_arg
+
+
+def _parse_timeouts(value):
+    # "get_travel_info=60,flight_search=30"
+    timeouts = {}
+    for item in value.split(","):
+        if "=" in item:
+            tool_name, timeout = item.split("=", 1)
+            timeouts[tool_name.strip()] = float(timeout)
+    return timeouts
+
+
+# Tools whose identical concurrent calls share one execution, and how long a
+# caller waits on someone else's execution before running the call itself.
+# flight_search also records results for the conversation that asked, so for
+# it the SerpAPI search underneath is coalesced instead (in tools.py), which
+# covers multi_flight_search's searches as well.
+COALESCE_TIMEOUTS = _parse_timeouts(os.getenv(
+    "COALESCE_TOOLS", "get_travel_info=60,create_itinerary=90,create_packing_list=90,flight_search=30"
+))
+SEARCH_LEVEL_TOOLS = {"flight_search", "multi_flight_search"}
+
+
+class Abandoned(Exception):
+    """The caller running a shared call went away before it finished."""
+
+
+def key(tool_name, args):
+    return json.dumps([tool_name, {name: normalize_arg(value) for name, value in args.items()}], sort_keys=True)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    call and everyone who arrives while it is in flight gets its result or
+    exception. Nothing is kept once the call finishes; that's the caches' job.
+
+    Callers that wait longer than their timeout, or whose leader was
+    abandoned, run the call themselves. Sync and async callers share the same
+    in-flight calls.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Returns (future, leader). The leader must call finish(); others wait on the future."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, timeout=None, label=None):
+        future, leader = self.begin(key)
+        if not leader:
+            try:
+                result = future.result(timeout)
+                COALESCED.inc(group=self.name, tool=label or "", outcome="joined")
+                return result
+            except FutureTimeoutError:
+                COALESCED.inc(group=self.name, tool=label or "", outcome="wait_timeout")
+            except Abandoned:
+                pass
+            return fn()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, future, error=e if isinstance(e, Exception) else Abandoned())
+            raise
+        self.finish(key, future, result=result)
+        return result
+
+    async def ado(self, key, fn, timeout=None, label=None):
+        """Async variant of do; `fn` returns an awaitable."""
+        future, leader = self.begin(key)
+        if not leader:
+            try:
+                # shield: a waiter timing out must not cancel the shared call
+                result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+                COALESCED.inc(group=self.name, tool=label or "", outcome="joined")
+                return result
+            except asyncio.TimeoutError:
+                COALESCED.inc(group=self.name, tool=label or "", outcome="wait_timeout")
+            except Abandoned:
+                pass
+            return await fn()
+
+        # Run the call as its own task so the waiters still get a result if the
+        # leader is cancelled (e.g. by its own tool timeout)
+        task = asyncio.ensure_future(fn())
+
+        def done(task):
+            if task.cancelled():
+                self.finish(key, future, error=Abandoned())
+            elif task.exception() is not None:
+                self.finish(key, future, error=task.exception())
+            else:
+                self.finish(key, future, result=task.result())
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+
+COALESCED = metrics.Counter("travel_agent_coalesced_calls_total",
+                            "Calls that waited on an identical in-flight call, by group, tool and outcome.")
+
+# Tool calls dispatched by the bot, and the upstream flight searches under flight tools
+tool_calls = SingleFlight("tool_calls")
+flight_searches = SingleFlight("flight_searches")
@@ -0,0 +1,170 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+# Histories smaller than this are stored as plain JSON; compressing them saves little
+COMPRESS_MIN_BYTES = 1024
+
+
+class Conflict(Exception):
+    """The conversation was written by someone else since it was loaded."""
+
+
+def dumps(state):
+    """Compact serialization: minified JSON, zlib-compressed when large enough to pay off."""
+    data = json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode()
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(data, 1)
+    return b"j" + data
+
+
+def loads(data):
+    data = bytes(data)
+    if data[:1] == b"z":
+        return json.loads(zlib.decompress(data[1:]))
+    return json.loads(data[1:])
+
+
+class SQLiteConversationStore:
+    """
+    Conversations in a SQLite file, shared by the worker processes of one
+    host and kept across restarts.
+
+    Every conversation has a version that each save bumps. save() only
+    succeeds if the version is still the one the caller loaded, so two workers
+    answering the same conversation can't silently overwrite each other.
+    Conversations not saved for `ttl` seconds are dropped.
+    """
+
+    def __init__(self, path, table="conversations", ttl=7 * 24 * 3600, prune_every=100):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._saves = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, version INTEGER NOT NULL, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_updated_at ON {table} (updated_at)")
+
+    def load(self, key):
+        """Returns (state, version); state is None for unknown or expired conversations."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT version, data, updated_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None, 0
+        version, data, updated_at = row
+        if self.ttl and time.time() - updated_at > self.ttl:
+            return None, version
+        return loads(data), version
+
+    def save(self, key, state, version):
+        """Stores `state` if the conversation is still at `version`; returns the new version or raises Conflict."""
+        data = dumps(state)
+        now = time.time()
+        with self._lock:
+            if version:
+                cursor = self._conn.execute(
+                    f"UPDATE {self.table} SET version = version + 1, data = ?, updated_at = ? "
+                    "WHERE key = ? AND version = ?",
+                    (data, now, key, version),
+                )
+            else:
+                cursor = self._conn.execute(
+                    f"INSERT INTO {self.table} (key, version, data, updated_at) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT(key) DO NOTHING",
+                    (key, data, now),
+                )
+            if cursor.rowcount != 1:
+                raise Conflict(key)
+            self._saves += 1
+            if self.ttl and self._saves % self.prune_every == 0:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE updated_at < ?", (now - self.ttl,))
+        return version + 1
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+# KEYS[1]: conversation key; ARGV: expected version, serialized state, ttl in seconds (0 = none).
+# Values are "<version>:<state>". Returns the new version, or -1 if the version moved on.
+SAVE_SCRIPT = """
+local current = redis.call("GET", KEYS[1])
+local version = 0
+if current then
+    version = tonumber(string.match(current, "^(%d+):"))
+end
+if version ~= tonumber(ARGV[1]) then
+    return -1
+end
+local value = (version + 1) .. ":" .. ARGV[2]
+if tonumber(ARGV[3]) > 0 then
+    redis.call("SET", KEYS[1], value, "EX", ARGV[3])
+else
+    redis.call("SET", KEYS[1], value)
+end
+return version + 1
+"""
+
+
+class RedisConversationStore:
+    """
+    Conversations in Redis, shared by workers on any number of hosts.
+
+    `client` is anything with redis-py's get, delete and register_script, e.g.
+    redis.Redis or replay.LocalRedis. The version check and write happen in one
+    server-side script, so saves have the same optimistic concurrency as
+    SQLiteConversationStore. Redis expires conversations after `ttl` seconds.
+    """
+
+    def __init__(self, client, prefix="travel_agent:conversation:", ttl=7 * 24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self._save = client.register_script(SAVE_SCRIPT)
+
+    def load(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None, 0
+        version, data = bytes(value).split(b":", 1)
+        return loads(data), int(version)
+
+    def save(self, key, state, version):
+        new_version = self._save(keys=[self.prefix + key], args=[version, dumps(state), int(self.ttl or 0)])
+        if int(new_version) < 0:
+            raise Conflict(key)
+        return int(new_version)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def make_store(url=None, ttl=7 * 24 * 3600):
+    """
+    Conversation store for `url`: "redis://..." or "rediss://..." for Redis,
+    "sqlite:///path" or a plain file path for SQLite. None keeps conversations
+    in process memory only.
+    """
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+
+        return RedisConversationStore(redis.Redis.from_url(url), ttl=ttl)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SQLiteConversationStore(url, ttl=ttl)
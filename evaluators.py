@@ -1,7 +1,12 @@
 import phoenix as px
 from phoenix.experiments import evaluate_experiment
+import functools
 import json
-import openai
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+import clients
 from phoenix.evals import (
     OpenAIModel,
     llm_classify,
@@ -27,24 +32,90 @@ def evaluate_router_function_call(output, expected):
     else:
         return 0
     
-def evaluate_router_param_extraction(output, expected):
-    output = output.get("messages")[-1]
-    if output.get("tool_calls"):
-        output = output.get("tool_calls")[0].get("function").get("arguments")
-    else:
-        if expected == "no tool call":
-            return 1
-        else:
-            return 0
-    expected = expected.get("parameters")
+# Keys the test data and the tools use for the same parameter
+PARAM_ALIASES = {
+    "departure": "origin",
+    "from": "origin",
+    "arrival": "destination",
+    "to": "destination",
+    "start_date": "checkin_date",
+    "end_date": "checkout_date",
+    "check_in_date": "checkin_date",
+    "check_out_date": "checkout_date",
+}
 
-    if isinstance(expected, str):
-        expected = json.loads(expected)
-    if isinstance(output, str):
-        output = json.loads(output)
-        
+CITY_AIRPORTS = {
+    "new york": {"JFK", "LGA", "EWR", "NYC"},
+    "los angeles": {"LAX"},
+    "boston": {"BOS"},
+    "miami": {"MIA"},
+    "chicago": {"ORD", "MDW", "CHI"},
+    "san francisco": {"SFO"},
+    "seattle": {"SEA"},
+    "london": {"LHR", "LGW", "STN", "LON"},
+    "paris": {"CDG", "ORY", "PAR"},
+    "tokyo": {"HND", "NRT", "TYO"},
+    "barcelona": {"BCN"},
+    "rome": {"FCO", "CIA", "ROM"},
+    "lisbon": {"LIS"},
+    "sydney": {"SYD"},
+}
+AIRPORT_CITIES = {code: city for city, codes in CITY_AIRPORTS.items() for code in codes}
 
-    response = openai.chat.completions.create(
+MONTHS = {month: i for i, month in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july",
+     "august", "september", "october", "november", "december"], start=1)}
+
+def _normalize_date(value):
+    """Returns (year or None, month, day) for ISO dates and dates like "March 10th" or "Mar 10, 2025"."""
+    text = value.strip().lower()
+    iso = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", text)
+    if iso:
+        return int(iso.group(1)), int(iso.group(2)), int(iso.group(3))
+    written = re.fullmatch(r"([a-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(\d{4}))?", text)
+    if written:
+        month = next((i for name, i in MONTHS.items() if name.startswith(written.group(1)[:3])), None)
+        if month:
+            year = int(written.group(3)) if written.group(3) else None
+            return year, month, int(written.group(2))
+    return None
+
+def _normalize_value(value):
+    if not isinstance(value, str):
+        return value
+    date = _normalize_date(value)
+    if date:
+        return date
+    text = value.strip()
+    if re.fullmatch(r"[A-Za-z]{3}", text) and text.upper() in AIRPORT_CITIES:
+        return AIRPORT_CITIES[text.upper()]
+    # "Sydney, Australia" -> "sydney"
+    return " ".join(text.split(",")[0].lower().split())
+
+def normalize_params(params):
+    return {PARAM_ALIASES.get(key, key): _normalize_value(value)
+            for key, value in params.items() if value not in (None, "")}
+
+def _values_match(expected, actual):
+    if isinstance(expected, tuple) and isinstance(actual, tuple):
+        # Dates without a year match on month and day
+        same_year = expected[0] is None or actual[0] is None or expected[0] == actual[0]
+        return same_year and expected[1:] == actual[1:]
+    return expected == actual
+
+def compare_params(expected, actual):
+    """
+    Deterministic comparison after key aliasing and date/IATA normalization.
+    Returns 1 for a match, or None when the judge has to decide.
+    """
+    expected, actual = normalize_params(expected), normalize_params(actual)
+    if expected.keys() == actual.keys() and all(_values_match(expected[k], actual[k]) for k in expected):
+        return 1
+    return None
+
+@functools.lru_cache(maxsize=4096)
+def _judge_params(expected, output):
+    response = clients.openai_client().chat.completions.create(
         model="gpt-4o-mini",
         messages=[
             {
@@ -65,8 +136,61 @@ def evaluate_router_param_extraction(output, expected):
     except ValueError:
         return 0
 
-def llm_eval_qa_answer():
-    llm_judge_prompt = """You are given a question and an answer. You must determine whether the
+def _extract_params(output, expected):
+    """Returns (expected, actual) parameter dicts, or a final score when there is nothing to compare."""
+    output = output.get("messages")[-1]
+    if output.get("tool_calls"):
+        output = output.get("tool_calls")[0].get("function").get("arguments")
+    else:
+        if expected == "no tool call":
+            return 1
+        else:
+            return 0
+    expected = expected.get("parameters")
+
+    if isinstance(expected, str):
+        expected = json.loads(expected)
+    if isinstance(output, str):
+        output = json.loads(output)
+    return expected, output
+
+def evaluate_router_param_extraction(output, expected):
+    params = _extract_params(output, expected)
+    if not isinstance(params, tuple):
+        return params
+    expected, output = params
+    
+    score = compare_params(expected, output)
+    if score is not None:
+        return score
+    return _judge_params(str(expected), str(output))
+
+def evaluate_router_param_extraction_batch(examples, concurrency=8):
+    """
+    Scores a list of (output, expected) pairs. Pairs that match after
+    normalization are scored locally; the rest go to the LLM judge on up to
+    `concurrency` threads, with identical pairs judged once.
+    """
+    scores = [None] * len(examples)
+    pending = {}
+    for i, (output, expected) in enumerate(examples):
+        params = _extract_params(output, expected)
+        if not isinstance(params, tuple):
+            scores[i] = params
+            continue
+        expected, output = params
+        scores[i] = compare_params(expected, output)
+        if scores[i] is None:
+            pending.setdefault((str(expected), str(output)), []).append(i)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        verdicts = dict(zip(pending, executor.map(lambda pair: _judge_params(*pair), pending)))
+    for pair, indices in pending.items():
+        for i in indices:
+            scores[i] = verdicts[pair]
+    return scores
+
+QA_JUDGE_PROMPT = """You are given a question and an answer. You must determine whether the
         given answer correctly answers the question. Here is the data:
             [BEGIN DATA]
             ************
@@ -80,13 +204,13 @@ def llm_eval_qa_answer():
         "incorrect" means that the question is not correctly or only partially answered by the
         answer.
             """
-    
-    query = SpanQuery().where("parent_id is None").select(question="input.value", answer="output.value")
-    spans = px.Client().query_spans(query, project_name="travel-agent-live")
-    
+
+QA_EVAL_CHECKPOINT_PATH = os.getenv("QA_EVAL_CHECKPOINT_PATH", ".qa_eval_checkpoint.json")
+
+def _classify_and_log(client, spans):
     eval_spans = llm_classify(
         model=OpenAIModel(model="gpt-4o-mini"),
-        template=llm_judge_prompt,
+        template=QA_JUDGE_PROMPT,
         data=spans,
         rails=["correct", "incorrect"],
         provide_explanation=True,
@@ -94,9 +218,73 @@ def llm_eval_qa_answer():
     )
     eval_spans["score"] = eval_spans["label"].apply(lambda x: 1 if x == "correct" else 0)
 
-    px.Client().log_evaluations(SpanEvaluations(eval_name="QA_Answer", dataframe=eval_spans))
+    client.log_evaluations(SpanEvaluations(eval_name="QA_Answer", dataframe=eval_spans))
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None, set()
+    return datetime.fromisoformat(checkpoint["watermark"]), set(checkpoint.get("page_evaluated_ids", []))
+
+def _save_checkpoint(path, watermark, page_evaluated_ids):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"watermark": watermark.isoformat(), "page_evaluated_ids": sorted(page_evaluated_ids)}, f)
+    os.replace(tmp_path, path)
+
+def _iter_span_pages(client, query, project_name, start, end, page_size):
+    """
+    Yields (window_end, spans) for consecutive time windows covering [start, end).
+    A window that returns a full page may have been truncated, so it is halved
+    and re-queried; after a short page the next window doubles.
+    """
+    cursor, window = start, end - start
+    while cursor < end:
+        window_end = min(cursor + window, end)
+        spans = client.query_spans(query, project_name=project_name,
+                                   start_time=cursor, end_time=window_end, limit=page_size)
+        if spans is not None and len(spans) >= page_size and window_end - cursor > timedelta(seconds=1):
+            window = (window_end - cursor) / 2
+            continue
+        yield window_end, spans
+        cursor = window_end
+        window *= 2
+
+def llm_eval_qa_answer(incremental=True, project_name="travel-agent-live", checkpoint_path=QA_EVAL_CHECKPOINT_PATH,
+                       page_size=1000, chunk_size=100, settle_seconds=120):
+    """
+    Judges root spans of `project_name` with the QA prompt and logs the results.
+
+    In incremental mode only spans that started after the persisted watermark are
+    queried, page by page, and classified and logged in chunks of `chunk_size`.
+    The checkpoint advances after every chunk, so an interrupted run resumes
+    without re-judging spans. Spans younger than `settle_seconds` are left for the
+    next run, since their root span may not have finished yet.
+    """
+    client = px.Client()
+    query = SpanQuery().where("parent_id is None").select(question="input.value", answer="output.value")
+    
+    if not incremental:
+        spans = client.query_spans(query, project_name=project_name)
+        _classify_and_log(client, spans)
+        return
     
+    watermark, page_evaluated_ids = _load_checkpoint(checkpoint_path)
+    start = watermark or datetime(1970, 1, 1, tzinfo=timezone.utc)
+    end = datetime.now(timezone.utc) - timedelta(seconds=settle_seconds)
     
+    for window_end, spans in _iter_span_pages(client, query, project_name, start, end, page_size):
+        if spans is not None and len(spans):
+            spans = spans[~spans.index.isin(page_evaluated_ids)]
+            for i in range(0, len(spans), chunk_size):
+                chunk = spans.iloc[i:i + chunk_size]
+                _classify_and_log(client, chunk)
+                page_evaluated_ids.update(chunk.index)
+                _save_checkpoint(checkpoint_path, start, page_evaluated_ids)
+        start, page_evaluated_ids = window_end, set()
+        _save_checkpoint(checkpoint_path, start, page_evaluated_ids)
 
 if __name__ == "__main__":
     # experiment = px.Client().get_experiment(experiment_id="RXhwZXJpbWVudDoxMzU=")
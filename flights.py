@@ -0,0 +1,269 @@
+import contextvars
+import math
+from datetime import date, timedelta
+
+SORT_KEYS = ("price", "duration", "stops", "departure")
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def format_minutes(total_minutes):
+    if not isinstance(total_minutes, int) or total_minutes < 0:
+        return "unknown"
+    hours = total_minutes // 60
+    minutes = total_minutes % 60
+    if hours > 0 and minutes > 0:
+        return f"{hours} hr {minutes} min"
+    elif hours > 0:
+        return f"{hours} hr"
+    else:
+        return f"{minutes} min"
+
+
+class Leg:
+    __slots__ = ("airline", "flight_number", "departure_airport", "departure_time",
+                 "arrival_airport", "arrival_time", "duration", "airplane")
+
+    def __init__(self, airline, flight_number, departure_airport, departure_time,
+                 arrival_airport, arrival_time, duration, airplane):
+        self.airline = airline
+        self.flight_number = flight_number
+        self.departure_airport = departure_airport
+        self.departure_time = departure_time
+        self.arrival_airport = arrival_airport
+        self.arrival_time = arrival_time
+        self.duration = duration
+        self.airplane = airplane
+
+    def to_row(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+    def format(self):
+        return (f"{self.airline} {self.flight_number} - {self.departure_airport} ({self.departure_time}) -> "
+                f"{self.arrival_airport} ({self.arrival_time}) [{format_minutes(self.duration)}] - {self.airplane}")
+
+
+class Flight:
+    """
+    One itinerary from a flight search: its legs, layovers as (airport, minutes)
+    pairs, total duration in minutes and price in USD (None when unknown).
+    `return_date` is only set when results of several searches are merged.
+    """
+
+    __slots__ = ("price", "total_duration", "legs", "layovers", "return_date")
+
+    def __init__(self, price, total_duration, legs, layovers=(), return_date=None):
+        self.price = price
+        self.total_duration = total_duration
+        self.legs = tuple(legs)
+        self.layovers = tuple(layovers)
+        self.return_date = return_date
+
+    @property
+    def stops(self):
+        return max(len(self.legs) - 1, 0)
+
+    @property
+    def airlines(self):
+        return {leg.airline for leg in self.legs}
+
+    def to_row(self):
+        row = [self.price, self.total_duration, [leg.to_row() for leg in self.legs],
+               [list(layover) for layover in self.layovers]]
+        if self.return_date:
+            row.append(self.return_date)
+        return row
+
+    @classmethod
+    def from_row(cls, row):
+        price, total_duration, legs, layovers, *return_date = row
+        return cls(price, total_duration, [Leg(*leg) for leg in legs], [tuple(layover) for layover in layovers],
+                   *return_date)
+
+    @classmethod
+    def from_serpapi(cls, flight):
+        legs = [
+            Leg(part.get("airline"), part.get("flight_number"),
+                part.get("departure_airport", {}).get("id"), part.get("departure_airport", {}).get("time"),
+                part.get("arrival_airport", {}).get("id"), part.get("arrival_airport", {}).get("time"),
+                part.get("duration"), part.get("airplane"))
+            for part in flight.get("flights", [])
+        ]
+        layovers = [(layover.get("id"), layover.get("duration")) for layover in flight.get("layovers", [])]
+        return cls(flight.get("price"), flight.get("total_duration"), legs, layovers)
+
+    def format(self):
+        lines = [leg.format() for leg in self.legs]
+        lines += [f"Layover at {airport}: {format_minutes(minutes)}" for airport, minutes in self.layovers]
+        lines.append(f"Total Duration: {format_minutes(self.total_duration)}")
+        if self.return_date:
+            lines.append(f"Return Date: {self.return_date}")
+        lines.append(f"Price (USD): ${self.price}" if self.price is not None else "Price (USD): unavailable")
+        return "\n".join(lines)
+
+
+def parse_serpapi(results):
+    """
+    Reduces a SerpAPI Google Flights response to compact rows (see Flight.to_row),
+    best flights first. Errors are passed through in the "error" key.
+    """
+    if "error" in results:
+        return {"error": results["error"]}
+    flights = results.get("best_flights", []) + results.get("other_flights", [])
+    return {"flights": [Flight.from_serpapi(flight).to_row() for flight in flights]}
+
+
+def _sort_key(sort_by):
+    if sort_by == "price":
+        return lambda f: f.price if f.price is not None else math.inf
+    if sort_by == "duration":
+        return lambda f: f.total_duration if f.total_duration is not None else math.inf
+    if sort_by == "stops":
+        return lambda f: (f.stops, f.price if f.price is not None else math.inf)
+    if sort_by == "departure":
+        return lambda f: (f.legs[0].departure_time or "") if f.legs else ""
+    raise ValueError(f"sort_by must be one of: {', '.join(SORT_KEYS)}")
+
+
+class FlightResults:
+    """
+    The flights found by one search. refine() filters and re-sorts them
+    locally, so follow-ups like "anything cheaper?" don't search again; text is
+    only produced by format().
+    """
+
+    def __init__(self, origin, destination, departure_date, return_date, flights):
+        self.origin = origin
+        self.destination = destination
+        self.departure_date = departure_date
+        self.return_date = return_date
+        self.flights = flights
+
+    @classmethod
+    def from_rows(cls, origin, destination, departure_date, return_date, rows):
+        return cls(origin, destination, departure_date, return_date, [Flight.from_row(row) for row in rows])
+
+    def to_rows(self):
+        return [flight.to_row() for flight in self.flights]
+
+    def to_state(self):
+        return [self.origin, self.destination, self.departure_date, self.return_date, self.to_rows()]
+
+    @classmethod
+    def from_state(cls, state):
+        return cls.from_rows(*state)
+
+    def refine(self, sort_by=None, max_price=None, max_stops=None, max_duration=None, airline=None):
+        flights = self.flights
+        if max_price is not None:
+            flights = [f for f in flights if f.price is not None and f.price <= max_price]
+        if max_stops is not None:
+            flights = [f for f in flights if f.stops <= max_stops]
+        if max_duration is not None:
+            flights = [f for f in flights if f.total_duration is not None and f.total_duration <= max_duration]
+        if airline:
+            wanted = airline.strip().lower()
+            flights = [f for f in flights if any(wanted in (name or "").lower() for name in f.airlines)]
+        if sort_by:
+            flights = sorted(flights, key=_sort_key(sort_by))
+        return FlightResults(self.origin, self.destination, self.departure_date, self.return_date, flights)
+
+    def format(self, limit=3):
+        if not self.flights:
+            return f"No flights found from {self.origin} to {self.destination}."
+        return f"Flights from {self.origin} to {self.destination}:\n\n" + "".join(
+            flight.format() + "\n\n" for flight in self.flights[:limit]
+        ).rstrip("\n") + "\n"
+
+
+def plan_searches(origins, destinations, earliest_departure, latest_departure=None,
+                  trip_length_days=None, departure_weekdays=None):
+    """
+    Expands routes and a departure date range into the distinct
+    (origin, destination, departure_date, return_date) searches to run.
+    Without `trip_length_days` the searches are one-way. Raises ValueError for
+    malformed dates or weekday names.
+    """
+    first = date.fromisoformat(earliest_departure)
+    last = date.fromisoformat(latest_departure) if latest_departure else first
+    if last < first:
+        raise ValueError("latest_departure_date is before earliest_departure_date")
+    weekdays = None
+    if departure_weekdays:
+        # "Friday", "friday" and "Fri" all work
+        abbreviations = [day[:3] for day in WEEKDAYS]
+        unknown = [day for day in departure_weekdays if day.strip().lower()[:3] not in abbreviations]
+        if unknown:
+            raise ValueError(f"Unknown weekdays: {', '.join(unknown)}")
+        weekdays = {abbreviations.index(day.strip().lower()[:3]) for day in departure_weekdays}
+
+    dates = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    dates = [day for day in dates if weekdays is None or day.weekday() in weekdays]
+    searches = {}
+    for origin in origins:
+        for destination in destinations:
+            origin, destination = origin.strip().upper(), destination.strip().upper()
+            if origin == destination:
+                continue
+            for day in dates:
+                return_date = (day + timedelta(days=trip_length_days)).isoformat() if trip_length_days else None
+                searches[(origin, destination, day.isoformat(), return_date)] = None
+    return list(searches)
+
+
+def merge(results):
+    """
+    Merges FlightResults from several searches into one, cheapest first. Each
+    flight remembers its return date, since the searches differ in dates.
+    """
+    merged = []
+    for result in results:
+        for flight in result.flights:
+            flight.return_date = result.return_date
+            merged.append(flight)
+    origins = dict.fromkeys(result.origin for result in results)
+    destinations = dict.fromkeys(result.destination for result in results)
+    return FlightResults(
+        ", ".join(origins), ", ".join(destinations),
+        min((result.departure_date for result in results), default=None),
+        None, merged,
+    ).refine(sort_by="price")
+
+
+class FlightSession:
+    """
+    Holds the results of a conversation's latest flight search.
+    """
+
+    __slots__ = ("results",)
+
+    def __init__(self):
+        self.results = None
+
+    def clear(self):
+        self.results = None
+
+    def to_state(self):
+        return self.results.to_state() if self.results is not None else None
+
+    def load_state(self, state):
+        self.results = FlightResults.from_state(state) if state else None
+
+
+# The FlightSession of the conversation currently being handled. Tool threads
+# and tasks inherit it along with the rest of the context.
+current_session = contextvars.ContextVar("flight_session", default=None)
+
+
+def bind_session(session):
+    current_session.set(session)
+
+
+def remember(results):
+    session = current_session.get()
+    if session is not None:
+        session.results = results
+
+
+def latest():
+    session = current_session.get()
+    return session.results if session is not None else None
@@ -7,8 +7,8 @@ import pandas as pd
 # Load environment variables
 load_dotenv()
 
-# Set up OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Set up an OpenAI client with explicit timeouts and retries
+client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=120, max_retries=5)
 
 def _generate_test_questions_for_router():
     """
@@ -39,7 +39,7 @@ def _generate_test_questions_for_router():
     }
     """
     
-    response = openai.chat.completions.create(
+    response = client.chat.completions.create(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "You are a helpful assistant that generates test questions for a travel agent chatbot."},
@@ -96,7 +96,7 @@ def generate_hard_agent_questions():
     Output a json object with a list of questions. Do not include a key or mention of the tool names, just the list of questions.
     """
     
-    response = openai.chat.completions.create(
+    response = client.chat.completions.create(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "You are a helpful assistant that generates test questions for a travel agent chatbot."},
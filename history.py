@@ -0,0 +1,119 @@
+_encoding = None
+
+
+def count_tokens(text):
+    """Token count using tiktoken when it is installed, else a ~4 chars/token estimate."""
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def message_tokens(message):
+    # A few tokens of per-message overhead on top of the content and any tool calls
+    tokens = count_tokens(str(message.get("content") or "")) + 4
+    for tool_call in message.get("tool_calls") or ():
+        tokens += count_tokens(tool_call["function"]["name"] + tool_call["function"]["arguments"]) + 4
+    return tokens
+
+
+class ConversationHistory:
+    """
+    Conversation messages sent to the router on every turn, kept within a token
+    budget.
+
+    After each turn `compact` shortens that turn's tool results to
+    `tool_result_chars` characters. Once the history is over `token_budget`
+    tokens, it drops the oldest turns until the history fits in
+    `trim_ratio` of the budget. Messages are not rewritten otherwise, so
+    between trims each request's history starts with the previous request's,
+    byte for byte, and the provider's prompt cache keeps matching it. When a
+    `summarizer(summary, messages)` is given, dropped turns are folded into a
+    running summary that is kept as the first message instead of being lost.
+    """
+
+    SUMMARY_PREFIX = "Summary of the earlier conversation: "
+    SHORTENED_SUFFIX = " characters omitted]"
+
+    def __init__(self, token_budget=None, tool_result_chars=600, trim_ratio=0.75, summarizer=None):
+        self.messages = []
+        self.token_budget = token_budget
+        self.tool_result_chars = tool_result_chars
+        self.trim_ratio = trim_ratio
+        self.summarizer = summarizer
+        self.summary = ""
+
+    def add_message(self, role, content):
+        self.messages.append({"role": role, "content": content})
+
+    def get_history(self):
+        return self.messages
+
+    def add_messages(self, messages):
+        self.messages.extend(messages)
+
+    def clear(self):
+        self.messages = []
+        self.summary = ""
+
+    def token_count(self):
+        return sum(message_tokens(msg) for msg in self.messages)
+
+    def _turn_starts(self):
+        return [i for i, msg in enumerate(self.messages) if msg["role"] == "user"]
+
+    def _compact_tool_results(self):
+        for msg in self.messages:
+            content = msg.get("content")
+            if (msg["role"] == "tool" and isinstance(content, str) and len(content) > self.tool_result_chars
+                    and not content.endswith(self.SHORTENED_SUFFIX)):
+                msg["content"] = (f"{content[:self.tool_result_chars]}... "
+                                  f"[earlier tool result shortened, {len(content) - self.tool_result_chars}"
+                                  f"{self.SHORTENED_SUFFIX}")
+
+    def compact(self):
+        """Shortens the finished turn's tool results and, once over budget, drops (or summarizes) the oldest turns."""
+        # Shortened once, right after their turn, so they read the same in every later request
+        self._compact_tool_results()
+
+        if not self.token_budget:
+            return
+        total = self.token_count()
+        if total <= self.token_budget:
+            return
+
+        has_summary = bool(self.summary) and bool(self.messages) and self.messages[0]["role"] == "system"
+        start = 1 if has_summary else 0
+
+        # Trim well below the budget so the next few turns don't each trim again
+        target = self.token_budget * self.trim_ratio
+        dropped = []
+        # Always keep the latest turn, even if it alone is over budget
+        while total > target:
+            turn_starts = [i for i in self._turn_starts() if i >= start]
+            if len(turn_starts) < 2:
+                break
+            end = turn_starts[1]
+            turn = self.messages[start:end]
+            del self.messages[start:end]
+            dropped.extend(turn)
+            total -= sum(message_tokens(msg) for msg in turn)
+
+        if dropped and self.summarizer:
+            try:
+                self.summary = self.summarizer(self.summary, dropped)
+            except Exception:
+                return
+            summary_message = {"role": "system", "content": self.SUMMARY_PREFIX + self.summary}
+            if has_summary:
+                self.messages[0] = summary_message
+            else:
+                self.messages.insert(0, summary_message)
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules the bot only needs once it handles a request (or, for gradio, once the UI is built)
+DEFERRED_MODULES = ["gradio", "openai", "phoenix.client", "opentelemetry.sdk", "openinference.instrumentation", "pandas"]
+
+
+def parse_importtime(stderr):
+    """
+    Parses `python -X importtime` output into (module, self_us, cumulative_us, depth)
+    tuples, in the order the imports finished.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def measure_import(module, cwd=None):
+    """Imports `module` in a fresh interpreter; returns its import time, wall time and what it imported."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    wall_time = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    imports = parse_importtime(result.stderr)
+    cumulative = next((c for name, _, c, depth in imports if name == module and depth == 0), 0)
+    return {
+        "import_ms": cumulative / 1000,
+        "wall_ms": wall_time * 1000,
+        "modules": {name for name, _, _, _ in imports},
+        "slowest": sorted(
+            ((name, c / 1000) for name, _, c, depth in imports if depth == 1), key=lambda item: -item[1]
+        ),
+    }
+
+
+def check_module(module, runs, budget_ms, deferred, cwd=None):
+    """Median import time of `module` over `runs` runs, checked against the budget and deferred modules."""
+    measurements = [measure_import(module, cwd) for _ in range(runs)]
+    import_ms = statistics.median(m["import_ms"] for m in measurements)
+    imported = sorted(
+        name for name in deferred
+        if any(found == name or found.startswith(name + ".") for found in measurements[0]["modules"])
+    )
+    return {
+        "module": module,
+        "import_ms": import_ms,
+        "wall_ms": statistics.median(m["wall_ms"] for m in measurements),
+        "budget_ms": budget_ms,
+        "over_budget": budget_ms is not None and import_ms > budget_ms,
+        "deferred_modules_imported": imported,
+        "slowest": measurements[0]["slowest"][:5],
+    }
+
+
+def check_startup(cwd=None):
+    """
+    Runs main.warm_up() with tracing on in a fresh interpreter, so deferred
+    start-up work that only fails once it runs (e.g. tracing set-up) is caught.
+    Returns None if it succeeded, else the error output.
+    """
+    env = {**os.environ, "TRACING_ENABLED": "true"}
+    env.setdefault("OPENAI_API_KEY", "offline")
+    result = subprocess.run([sys.executable, "-c", "import main; main.warm_up()"],
+                            cwd=cwd, env=env, capture_output=True, text=True)
+    return None if result.returncode == 0 else result.stderr[-2000:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the import time of the agent's entry points with python -X importtime."
+    )
+    parser.add_argument("--modules", nargs="+", default=["main", "tools", "run_hard_questions"])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module; the median is reported")
+    parser.add_argument("--budget-ms", type=float, default=500, help="Fail if a module takes longer to import")
+    parser.add_argument("--allow", nargs="*", default=[], help="Deferred modules that may be imported anyway")
+    parser.add_argument("--skip-startup-check", action="store_true", help="Don't run main.warm_up() with tracing on")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    deferred = [name for name in DEFERRED_MODULES if name not in args.allow]
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    results = [check_module(module, args.runs, args.budget_ms, deferred, cwd) for module in args.modules]
+    for result in results:
+        status = "ok" if not result["over_budget"] and not result["deferred_modules_imported"] else "FAIL"
+        slowest = ", ".join(f"{name} {ms:.0f}ms" for name, ms in result["slowest"][:3])
+        print(f"{status:<4} {result['module']:<20} import={result['import_ms']:7.1f}ms  "
+              f"wall={result['wall_ms']:7.1f}ms  budget={args.budget_ms:g}ms  slowest: {slowest}")
+        if result["deferred_modules_imported"]:
+            print(f"     imports {', '.join(result['deferred_modules_imported'])} at import time")
+
+    startup_error = None if args.skip_startup_check else check_startup(cwd)
+    if not args.skip_startup_check:
+        print("ok   warm_up with tracing on" if startup_error is None
+              else f"FAIL warm_up with tracing on:\n{startup_error}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"modules": results, "startup_error": startup_error}, f, indent=2)
+    if startup_error is not None or any(r["over_budget"] or r["deferred_modules_imported"] for r in results):
+        sys.exit(1)
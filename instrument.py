@@ -1,12 +1,164 @@
-from phoenix.otel import register
-from openinference.instrumentation.openai import OpenAIInstrumentor
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from opentelemetry import trace as trace_api
+from opentelemetry.sdk.trace import SpanLimits, SpanProcessor
+from opentelemetry.sdk.trace import TracerProvider as SDKTracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+from openinference.instrumentation import OITracer, TraceConfig
+from openinference.instrumentation.openai import OpenAIInstrumentor
+from phoenix.otel import PROJECT_NAME, HTTPSpanExporter, Resource, TracerProvider
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).lower() == "true"
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Buffers the spans of each trace until its root span ends, then forwards the
+    whole trace to `delegate` if any span errored, the root took at least
+    `slow_threshold` seconds, or a `sample_ratio` coin flip says so. At most
+    `max_buffered_traces` unfinished traces are held; the oldest is dropped
+    when that bound is hit.
+
+    Each trace's decision is remembered for `decision_ttl` seconds (for at most
+    `max_decisions` traces), so spans that end after their root, e.g. from
+    background prefetches, are forwarded or dropped right away with the rest of
+    their trace instead of waiting in the buffer to be evicted.
+    """
+
+    def __init__(self, delegate, sample_ratio=1.0, slow_threshold=10.0, max_buffered_traces=2048,
+                 decision_ttl=60.0, max_decisions=8192):
+        self.delegate = delegate
+        self.sample_ratio = sample_ratio
+        self.slow_threshold = slow_threshold
+        self.max_buffered_traces = max_buffered_traces
+        self.decision_ttl = decision_ttl
+        self.max_decisions = max_decisions
+        self.dropped_traces = 0
+        self._traces = OrderedDict()
+        self._decisions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None):
+        self.delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        now = time.monotonic()
+        with self._lock:
+            self._expire_decisions(now)
+            decision = self._decisions.get(trace_id)
+            if decision is not None and not is_root:
+                # The trace was already decided; this late span follows the rest of it
+                spans = [span] if decision[0] else []
+            else:
+                self._traces.setdefault(trace_id, []).append(span)
+                if not is_root:
+                    if len(self._traces) > self.max_buffered_traces:
+                        self._traces.popitem(last=False)
+                        self.dropped_traces += 1
+                    return
+                spans = self._traces.pop(trace_id)
+                keep = self._keep(span, spans)
+                self._decisions[trace_id] = (keep, now)
+                self._decisions.move_to_end(trace_id)
+                if not keep:
+                    spans = []
+
+        for buffered in spans:
+            self.delegate.on_end(buffered)
 
-def setup_tracing():
-    tracer_provider = register(
-        project_name="travel-agent",
-        auto_instrument=True,
+    def _expire_decisions(self, now):
+        while self._decisions:
+            _, decided_at = next(iter(self._decisions.values()))
+            if now - decided_at <= self.decision_ttl and len(self._decisions) <= self.max_decisions:
+                break
+            self._decisions.popitem(last=False)
+
+    def _keep(self, root, spans):
+        if any(s.status.status_code == StatusCode.ERROR for s in spans):
+            return True
+        if root.end_time and root.start_time and (root.end_time - root.start_time) / 1e9 >= self.slow_threshold:
+            return True
+        return random.random() < self.sample_ratio
+
+    def shutdown(self):
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self.delegate.force_flush(timeout_millis)
+
+
+def setup_tracing(
+    project_name="travel-agent",
+    enabled=None,
+    sample_ratio=None,
+    tail_sample_ratio=None,
+    slow_threshold=None,
+    max_queue_size=None,
+    max_export_batch_size=None,
+    schedule_delay_millis=None,
+    export_timeout_millis=None,
+    max_attribute_length=None,
+    hide_payloads=None,
+):
+    """
+    Sets up Phoenix tracing and returns the tracer used by the bot's decorators.
+
+    Spans are exported in the background by a batch processor with a bounded
+    queue; spans that arrive while the queue is full are dropped rather than
+    slowing requests down. `sample_ratio` head-samples traces before any span is
+    recorded. `tail_sample_ratio` thins out the recorded traces once they finish,
+    always keeping traces with errors or a root span slower than
+    `slow_threshold` seconds. Attribute values longer than
+    `max_attribute_length` are truncated, and `hide_payloads` redacts prompt and
+    completion content. Every option defaults to an environment variable.
+    With tracing disabled, the decorators still work but record nothing.
+    """
+    enabled = _env_flag("TRACING_ENABLED", "true") if enabled is None else enabled
+    trace_config = TraceConfig(**({
+        "hide_inputs": True,
+        "hide_outputs": True,
+        "hide_input_messages": True,
+        "hide_output_messages": True,
+    } if (_env_flag("TRACE_HIDE_PAYLOADS", "false") if hide_payloads is None else hide_payloads) else {}))
+    if not enabled:
+        return OITracer(trace_api.NoOpTracer(), config=trace_config)
+
+    sample_ratio = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0")) if sample_ratio is None else sample_ratio
+    tail_sample_ratio = float(os.getenv("TRACE_TAIL_SAMPLE_RATIO", "1.0")) if tail_sample_ratio is None else tail_sample_ratio
+    slow_threshold = float(os.getenv("TRACE_SLOW_THRESHOLD_SECONDS", "10")) if slow_threshold is None else slow_threshold
+    max_attribute_length = int(os.getenv("TRACE_MAX_ATTRIBUTE_LENGTH", "8192")) if max_attribute_length is None else max_attribute_length
+
+    tracer_provider = TracerProvider(
+        resource=Resource({PROJECT_NAME: project_name}),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+        span_limits=SpanLimits(max_span_attribute_length=max_attribute_length),
+    )
+    # Phoenix's own BatchSpanProcessor doesn't expose the queue settings, so its
+    # exporter (endpoint and auth headers from the PHOENIX_* env) goes in the SDK's
+    span_processor = BatchSpanProcessor(
+        HTTPSpanExporter(),
+        max_queue_size=max_queue_size or int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", "2048")),
+        max_export_batch_size=max_export_batch_size or int(os.getenv("TRACE_EXPORT_BATCH_SIZE", "512")),
+        schedule_delay_millis=schedule_delay_millis or int(os.getenv("TRACE_EXPORT_DELAY_MS", "2000")),
+        export_timeout_millis=export_timeout_millis or int(os.getenv("TRACE_EXPORT_TIMEOUT_MS", "10000")),
     )
-    
-    tracer = tracer_provider.get_tracer(__name__)
-    return tracer
\ No newline at end of file
+    if tail_sample_ratio < 1.0:
+        span_processor = TailSamplingSpanProcessor(span_processor, sample_ratio=tail_sample_ratio,
+                                                   slow_threshold=slow_threshold)
+    tracer_provider.add_span_processor(span_processor)
+    trace_api.set_tracer_provider(tracer_provider)
+
+    OpenAIInstrumentor().instrument(tracer_provider=tracer_provider, config=trace_config)
+
+    tracer = OITracer(SDKTracerProvider.get_tracer(tracer_provider, __name__), config=trace_config)
+    return tracer
@@ -1,69 +1,340 @@
+import asyncio
+import contextvars
 import json
-import gradio as gr
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import os
-import openai
-from openinference.instrumentation import using_session
 import uuid
-from instrument import setup_tracing
+import admission
+import clients
+import coalesce
+import conversation_store
+import flights
+import metrics
+import pre_router
 import prompts
+import speculation
 import tools
+from tracing import LazyTracer, using_session
+from history import ConversationHistory
+from sessions import SessionStore
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
 
-tracer = setup_tracing()
-session_id = str(uuid.uuid4())
+# Tracing is set up on the first traced call (or at boot by warm_up) rather than on import
+tracer = LazyTracer()
 
-class ConversationHistory:
-    def __init__(self):
-        self.messages = []
-    
-    def add_message(self, role, content):
-        self.messages.append({"role": role, "content": content})
-    
-    def get_history(self):
-        return self.messages
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "60"))
+
+def _parse_tool_timeouts(value):
+    # "flight_search=30,create_itinerary=90"
+    timeouts = {}
+    for item in value.split(","):
+        if "=" in item:
+            tool_name, timeout = item.split("=", 1)
+            timeouts[tool_name.strip()] = float(timeout)
+    return timeouts
+
+TOOL_TIMEOUTS = _parse_tool_timeouts(os.getenv("TOOL_TIMEOUTS", ""))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+HISTORY_TOOL_RESULT_CHARS = int(os.getenv("HISTORY_TOOL_RESULT_CHARS", "600"))
+HISTORY_TRIM_RATIO = float(os.getenv("HISTORY_TRIM_RATIO", "0.75"))
+HISTORY_SUMMARIZE = os.getenv("HISTORY_SUMMARIZE", "false").lower() == "true"
+
+def summarize_turns(summary, messages):
+    """Folds turns dropped from the history into the running conversation summary."""
+    transcript = "\n".join(f"{msg['role']}: {str(msg['content'])[:1000]}" for msg in messages if msg.get("content"))
+    response = clients.openai_client().chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": "You maintain a short running summary of a conversation with a travel agent. Keep destinations, dates, budgets, preferences and decisions. Answer with the updated summary only, in at most 120 words."
+            },
+            {
+                "role": "user",
+                "content": f"Current summary: {summary or '(none)'}\n\nNew turns:\n{transcript}"
+            }
+        ],
+    )
+    return response.choices[0].message.content.strip()
+
+_pre_router = None
+
+def get_pre_router():
+    """The shared local pre-router when PRE_ROUTER_ENABLED is set, else None."""
+    global _pre_router
+    if pre_router.PRE_ROUTER_ENABLED and _pre_router is None:
+        _pre_router = pre_router.PreRouter()
+    return _pre_router
+
+_speculator = None
+
+def get_speculator():
+    """The shared follow-up prefetcher when SPECULATION_ENABLED is set, else None."""
+    global _speculator
+    if speculation.SPECULATION_ENABLED and _speculator is None:
+        _speculator = speculation.Speculator()
+    return _speculator
+
+def _collect_tool_call_deltas(deltas, tool_calls):
+    # Streamed tool calls arrive in fragments keyed by index; stitch them back together.
+    for delta in deltas:
+        tool_call = tool_calls.setdefault(delta.index, {"id": None, "name": "", "arguments": ""})
+        if delta.id:
+            tool_call["id"] = delta.id
+        if delta.function and delta.function.name:
+            tool_call["name"] += delta.function.name
+        if delta.function and delta.function.arguments:
+            tool_call["arguments"] += delta.function.arguments
+    return tool_calls
+
+class _ToolRun:
+    """A streamed tool call; its output arrives on `parts` as ("part" | "done" | "timeout" | "error", value) pairs."""
     
-    def add_messages(self, messages):
-        self.messages.extend(messages)
+    __slots__ = ("tool_call", "tool_args", "timeout", "parts")
     
-    def clear(self):
-        self.messages = []
+    def __init__(self, tool_call, tool_args, timeout, parts):
+        self.tool_call = tool_call
+        self.tool_args = tool_args
+        self.timeout = timeout
+        self.parts = parts
 
 class TravelAgentBot:
-    def __init__(self):
-        self.history = ConversationHistory()
+    def __init__(self, tool_concurrency=None, tool_timeouts=None, pre_router=None, speculator=None,
+                 coalesce_timeouts=None):
+        self.history = ConversationHistory(
+            token_budget=HISTORY_TOKEN_BUDGET,
+            tool_result_chars=HISTORY_TOOL_RESULT_CHARS,
+            trim_ratio=HISTORY_TRIM_RATIO,
+            summarizer=summarize_turns if HISTORY_SUMMARIZE else None,
+        )
+        self.session_id = str(uuid.uuid4())
+        self.flight_session = flights.FlightSession()
+        self.tool_concurrency = tool_concurrency or TOOL_CONCURRENCY
+        self.tool_timeouts = {**TOOL_TIMEOUTS, **(tool_timeouts or {})}
+        self.coalesce_timeouts = coalesce.COALESCE_TIMEOUTS if coalesce_timeouts is None else coalesce_timeouts
+        self.pre_router = pre_router if pre_router is not None else get_pre_router()
+        self.speculator = speculator if speculator is not None else get_speculator()
+        # The last router request and how many history messages it holds; see _build_router_request
+        self._router_request = None
+        self._router_request_sent = 0
+    
+    def _tool_timeout(self, tool_name):
+        return self.tool_timeouts.get(tool_name, TOOL_TIMEOUT)
+    
+    @staticmethod
+    def _timeout_text(tool_name, timeout):
+        return f"Tool {tool_name} timed out after {timeout:g} seconds."
+    
+    @classmethod
+    def _tool_timeout_message(cls, tool_call, timeout):
+        return {"role": "tool", "content": cls._timeout_text(tool_call.function.name, timeout),
+                "tool_call_id": tool_call.id}
+    
+    @staticmethod
+    def _tool_error_text(tool_name, error):
+        logger.warning("Tool %s failed", tool_name, exc_info=error)
+        return f"Tool {tool_name} failed: {error}"
+    
+    @classmethod
+    def _tool_error_message(cls, tool_call_id, tool_name, error):
+        # Like a timeout, a failed call is answered so the other calls' results are kept
+        return {"role": "tool", "content": cls._tool_error_text(tool_name, error), "tool_call_id": tool_call_id}
+    
+    @staticmethod
+    def _answer_unanswered_tool_calls(messages, error):
+        """
+        Answers the tool calls of the turn's assistant message that got no result
+        because the turn failed or was cancelled. Every tool_call_id needs a tool
+        message, or each later request in the conversation is rejected.
+        """
+        reason = (str(error) or type(error).__name__) if isinstance(error, Exception) else "the request was cancelled"
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i]["role"] == "user":
+                return
+            if messages[i]["role"] == "assistant" and messages[i].get("tool_calls"):
+                answered = {msg.get("tool_call_id") for msg in messages[i + 1:]}
+                messages.extend(
+                    {"role": "tool", "content": f"Tool {call['function']['name']} failed: {reason}",
+                     "tool_call_id": call["id"]}
+                    for call in messages[i]["tool_calls"] if call["id"] not in answered
+                )
+                return
+    
+    @staticmethod
+    def _parse_tool_args(tool_name, arguments):
+        # Malformed JSON raises a ValueError as well
+        return tools.validate_tool_args(tool_name, json.loads(arguments))
+    
+    @staticmethod
+    def _invalid_tool_call_message(tool_call_id, tool_name, error):
+        return {"role": "tool", "content": f"Invalid call to {tool_name}: {error}", "tool_call_id": tool_call_id}
+    
+    def _coalesce_timeout(self, tool_name):
+        # Flight tools coalesce their searches themselves; see coalesce.COALESCE_TIMEOUTS
+        if tool_name in coalesce.SEARCH_LEVEL_TOOLS:
+            return None
+        return self.coalesce_timeouts.get(tool_name)
+    
+    def _run_tool(self, tool_name, tool_args):
+        timeout = self._coalesce_timeout(tool_name)
+        if timeout is None:
+            return tools.TOOLS[tool_name](**tool_args)
+        # Identical calls already in flight for other conversations share one execution
+        return coalesce.tool_calls.do(coalesce.key(tool_name, tool_args), lambda: tools.TOOLS[tool_name](**tool_args),
+                                      timeout=timeout, label=tool_name)
+    
+    def _speculate(self, tool_name, tool_args):
+        # Start likely follow-up tool calls in the background
+        if self.speculator is not None:
+            self.speculator.after_tool_call(tool_name, tool_args)
     
     @tracer.tool(name="process_tool_call")
-    def _process_tool_call(self, tool_call, messages):
+    @metrics.timed(metrics.STAGE_SECONDS, stage="tool_call")
+    def _process_tool_call(self, tool_call):
         tool_name = tool_call.function.name
-        tool_args = json.loads(tool_call.function.arguments)
-        tool_result = getattr(tools, tool_name)(**tool_args)
-        messages.append({"role": "tool", "content": tool_result, "tool_call_id": tool_call.id})
-        return messages
+        try:
+            tool_args = self._parse_tool_args(tool_name, tool_call.function.arguments)
+        except ValueError as e:
+            return self._invalid_tool_call_message(tool_call.id, tool_name, e)
+        tool_result = self._run_tool(tool_name, tool_args)
+        self._speculate(tool_name, tool_args)
+        return {"role": "tool", "content": tool_result, "tool_call_id": tool_call.id}
     
     @tracer.chain(name="process_tool_calls")
     def process_tool_calls(self, response, messages):
-        for tool_call in response.choices[0].message.tool_calls:
-            messages = self._process_tool_call(tool_call, messages)
+        tool_calls = response.choices[0].message.tool_calls
+        # At most tool_concurrency calls run at once, started in order here. Each call's
+        # timeout runs from when it starts; a call that times out keeps its thread until
+        # it finishes, so the pool has a thread per call rather than per slot.
+        executor = ThreadPoolExecutor(max_workers=len(tool_calls))
+        results = [None] * len(tool_calls)
+        pending = deque(enumerate(tool_calls))
+        running = {}
+        try:
+            while pending or running:
+                while pending and len(running) < self.tool_concurrency:
+                    i, tool_call = pending.popleft()
+                    timeout = self._tool_timeout(tool_call.function.name)
+                    # Each thread gets a copy of the current context so the tool spans stay
+                    # parented under this chain span.
+                    future = executor.submit(contextvars.copy_context().run, self._process_tool_call, tool_call)
+                    running[future] = (i, tool_call, timeout, time.monotonic() + timeout)
+                next_deadline = min(deadline for _, _, _, deadline in running.values())
+                done, _ = wait(running, timeout=max(0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                now = time.monotonic()
+                for future, (i, tool_call, timeout, deadline) in list(running.items()):
+                    if future in done:
+                        try:
+                            results[i] = future.result()
+                        except Exception as e:
+                            results[i] = self._tool_error_message(tool_call.id, tool_call.function.name, e)
+                    elif deadline <= now:
+                        results[i] = self._tool_timeout_message(tool_call, timeout)
+                    else:
+                        continue
+                    del running[future]
+        finally:
+            # Don't block the turn on tool threads that timed out
+            executor.shutdown(wait=False, cancel_futures=True)
+        # Results are appended in the original tool_call order
+        messages.extend(results)
         return messages
     
+    def _build_router_request(self, router_prompt, messages):
+        """
+        Orders the router request as the prompt's system messages (with the tools in
+        kwargs), then the append-only conversation, then any template messages that
+        vary with the question. history.compact only rewrites the history when it
+        trims it, so until then everything before the newest turn is identical to the
+        previous request and the provider's prompt cache can reuse it.
+
+        The request list is kept between turns and only the new messages are added
+        to it, so a turn doesn't copy the whole history. It is rebuilt when the prompt
+        changes or the history was trimmed, cleared or replaced.
+        """
+        formatted_prompt = router_prompt.format(variables={"question": messages[-1]["content"]})
+        prefix, suffix = [], []
+        for msg in formatted_prompt.get('messages'):
+            (prefix if msg["role"] in ("system", "developer") else suffix).append(msg)
+        
+        request, sent = self._router_request, self._router_request_sent
+        if (request is None or not 0 < sent <= len(messages) or request[:len(prefix)] != prefix
+                or request[len(prefix)] is not messages[0] or request[len(prefix) + sent - 1] is not messages[sent - 1]):
+            request, sent = [*prefix], 0
+        else:
+            # Drop the previous question's template messages
+            del request[len(prefix) + sent:]
+        request.extend(messages[sent:])
+        request.extend(suffix)
+        self._router_request, self._router_request_sent = request, len(messages)
+        return request, formatted_prompt.kwargs
+    
+    @staticmethod
+    def _assistant_message(content, tool_calls=()):
+        # Tool results are only valid after the assistant message that requested them,
+        # so the calls are kept in the history along with the text
+        message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = [
+                {"id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}
+                for call_id, name, arguments in tool_calls
+            ]
+        elif content is None:
+            message["content"] = ""
+        return message
+    
+    @staticmethod
+    def _last_response(messages):
+        # Get the assistant's response from the last message
+        for msg in reversed(messages):
+            if msg["role"] == "assistant" or msg["role"] == "tool":
+                assistant_response = msg["content"]
+                return assistant_response
+        
+        return "I'm processing your request."
+    
+    def _pre_route(self, messages):
+        # Obvious requests go straight to a tool without the LLM router
+        if self.pre_router is None:
+            return None
+        return self.pre_router.route(messages[-1]["content"])
+    
     @tracer.chain(name="route_request")
+    @metrics.timed(metrics.STAGE_SECONDS, stage="route_request")
     def get_openai_response(self, messages):
+        tool_call = self._pre_route(messages)
+        if tool_call is not None:
+            messages.append(self._assistant_message(
+                None, [(tool_call.id, tool_call.function.name, tool_call.function.arguments)]
+            ))
+            try:
+                messages.append(self._process_tool_call(tool_call))
+            except Exception as e:
+                messages.append(self._tool_error_message(tool_call.id, tool_call.function.name, e))
+            return messages
         
         router_prompt = prompts.get_prompt("travel-agent-router")
-        formatted_prompt = router_prompt.format(variables={"question": messages[-1]["content"]})
-        prompt_messages = messages + formatted_prompt.get('messages')
-        
-        # Remove any messages with content=None
-        prompt_messages = [msg for msg in prompt_messages if msg.get("content") is not None]
+        prompt_messages, kwargs = self._build_router_request(router_prompt, messages)
         
-        response = openai.chat.completions.create(
-            messages=prompt_messages,
-            **formatted_prompt.kwargs
-        )
+        with metrics.timed(metrics.STAGE_SECONDS, stage="router_llm"):
+            response = clients.openai_client().chat.completions.create(
+                messages=prompt_messages,
+                **kwargs
+            )
+        metrics.record_tokens("router", response.usage)
         
-        messages.append({"role": response.choices[0].message.role, 
-                         "content": response.choices[0].message.content})
+        message = response.choices[0].message
+        messages.append(self._assistant_message(message.content, [
+            (tool_call.id, tool_call.function.name, tool_call.function.arguments)
+            for tool_call in message.tool_calls or []
+        ]))
         
         if response.choices[0].message.tool_calls:
             messages = self.process_tool_calls(response, messages)
@@ -75,67 +346,474 @@ class TravelAgentBot:
         if not user_input.strip():
             return "Please enter a message."
         
+        # Lets flight tools keep and refine this conversation's results
+        flights.bind_session(self.flight_session)
+        
         # Add user message to history
         self.history.add_message("user", user_input)
         
         messages = self.history.get_history()
-        messages = self.get_openai_response(messages)
-        
-        # Get the assistant's response from the last message
-        for msg in reversed(messages):
-            if msg["role"] == "assistant" or msg["role"] == "tool":
-                assistant_response = msg["content"]
-                return assistant_response
+        try:
+            messages = self.get_openai_response(messages)
+        except BaseException as e:
+            # The history outlives this turn; don't leave it with unanswered tool calls
+            self._answer_unanswered_tool_calls(messages, e)
+            raise
+        assistant_response = self._last_response(messages)
         
-        return "I'm processing your request."
+        # Keep the prompt size per turn roughly constant
+        self.history.compact()
+        return assistant_response
     
     def clear_history(self):
-        session_id = str(uuid.uuid4())
+        self.session_id = str(uuid.uuid4())
+        self.flight_session.clear()
         self.history.clear()
         return "Conversation history cleared."
+    
+    def to_state(self):
+        """Everything a worker needs to carry on this conversation, as JSON-serializable data."""
+        return {
+            "session_id": self.session_id,
+            "messages": self.history.get_history(),
+            "summary": self.history.summary,
+            "flights": self.flight_session.to_state(),
+        }
+    
+    def load_state(self, state):
+        self.session_id = state["session_id"]
+        self.history.messages = state["messages"]
+        self.history.summary = state["summary"]
+        self.flight_session.load_state(state["flights"])
+
+class AsyncTravelAgentBot(TravelAgentBot):
+    """
+    TravelAgentBot whose prompt fetches, LLM calls and tools are awaited, so many
+    conversations can wait on upstream calls concurrently in one event loop.
+    """
+    
+    async def _run_tool_async(self, tool_name, tool_args):
+        timeout = self._coalesce_timeout(tool_name)
+        if timeout is None:
+            return await tools.ASYNC_TOOLS[tool_name](**tool_args)
+        return await coalesce.tool_calls.ado(coalesce.key(tool_name, tool_args),
+                                             lambda: tools.ASYNC_TOOLS[tool_name](**tool_args),
+                                             timeout=timeout, label=tool_name)
+    
+    async def _stream_tool_async(self, tool_name, tool_args):
+        timeout = self._coalesce_timeout(tool_name)
+        if timeout is None:
+            async for part in tools.stream_tool_async(tool_name, tool_args):
+                yield part
+            return
+        
+        key = coalesce.key(tool_name, tool_args)
+        future, leader = coalesce.tool_calls.begin(key)
+        if not leader:
+            try:
+                yield await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+                coalesce.COALESCED.inc(group="tool_calls", tool=tool_name, outcome="joined")
+                return
+            except asyncio.TimeoutError:
+                coalesce.COALESCED.inc(group="tool_calls", tool=tool_name, outcome="wait_timeout")
+            except coalesce.Abandoned:
+                pass
+            async for part in tools.stream_tool_async(tool_name, tool_args):
+                yield part
+            return
+        
+        parts = []
+        try:
+            async for part in tools.stream_tool_async(tool_name, tool_args):
+                parts.append(part)
+                yield part
+        except BaseException as e:
+            coalesce.tool_calls.finish(key, future, error=e if isinstance(e, Exception) else coalesce.Abandoned())
+            raise
+        coalesce.tool_calls.finish(key, future, result="".join(parts))
+    
+    def _prepare_streamed_tool_calls(self, tool_calls):
+        """
+        Pairs each streamed tool call with a _ToolRun, or with the invalid-call message
+        that answers it if its arguments don't validate.
+        """
+        calls = []
+        for tool_call in tool_calls:
+            try:
+                tool_args = self._parse_tool_args(tool_call["name"], tool_call["arguments"])
+            except ValueError as e:
+                calls.append((tool_call, self._invalid_tool_call_message(tool_call["id"], tool_call["name"], e)))
+                continue
+            calls.append((tool_call, _ToolRun(tool_call, tool_args, self._tool_timeout(tool_call["name"]),
+                                              asyncio.Queue())))
+        return calls
+    
+    async def _stream_tool_calls_async(self, tool_calls, messages):
+        """
+        Runs a turn's tool calls like process_tool_calls_async, each as a task under the
+        concurrency limit and with its own timeout from when it starts, and streams their
+        output in tool_call order while the later calls run.
+        """
+        calls = self._prepare_streamed_tool_calls(tool_calls)
+        semaphore = asyncio.Semaphore(self.tool_concurrency)
+        
+        async def pump(run):
+            with metrics.timed(metrics.STAGE_SECONDS, stage="tool_call"):
+                async for part in self._stream_tool_async(run.tool_call["name"], run.tool_args):
+                    run.parts.put_nowait(("part", part))
+        
+        async def execute(run):
+            # The timeout starts once the call has a slot
+            async with semaphore:
+                try:
+                    await asyncio.wait_for(pump(run), run.timeout)
+                    run.parts.put_nowait(("done", None))
+                except asyncio.TimeoutError:
+                    run.parts.put_nowait(("timeout", None))
+                except Exception as e:
+                    run.parts.put_nowait(("error", e))
+        
+        # Tasks are created in tool_call order, so they get their slots in that order too
+        tasks = [asyncio.ensure_future(execute(run)) for _, run in calls if isinstance(run, _ToolRun)]
+        try:
+            for i, (tool_call, run) in enumerate(calls):
+                if i:
+                    yield "\n\n"
+                if not isinstance(run, _ToolRun):
+                    messages.append(run)
+                    yield run["content"]
+                    continue
+                parts = []
+                while True:
+                    kind, value = await run.parts.get()
+                    if kind != "part":
+                        break
+                    parts.append(value)
+                    yield value
+                if kind == "timeout":
+                    parts.append(("\n\n" if parts else "") + self._timeout_text(tool_call["name"], run.timeout))
+                    yield parts[-1]
+                elif kind == "error":
+                    parts.append(("\n\n" if parts else "") + self._tool_error_text(tool_call["name"], value))
+                    yield parts[-1]
+                else:
+                    self._speculate(tool_call["name"], run.tool_args)
+                messages.append({"role": "tool", "content": "".join(parts), "tool_call_id": tool_call["id"]})
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    @tracer.tool(name="process_tool_call")
+    @metrics.timed(metrics.STAGE_SECONDS, stage="tool_call")
+    async def _process_tool_call_async(self, tool_call):
+        tool_name = tool_call.function.name
+        try:
+            tool_args = self._parse_tool_args(tool_name, tool_call.function.arguments)
+        except ValueError as e:
+            return self._invalid_tool_call_message(tool_call.id, tool_name, e)
+        tool_result = await self._run_tool_async(tool_name, tool_args)
+        self._speculate(tool_name, tool_args)
+        return {"role": "tool", "content": tool_result, "tool_call_id": tool_call.id}
+    
+    @tracer.chain(name="process_tool_calls")
+    async def process_tool_calls_async(self, response, messages):
+        semaphore = asyncio.Semaphore(self.tool_concurrency)
+        
+        async def run(tool_call):
+            timeout = self._tool_timeout(tool_call.function.name)
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(self._process_tool_call_async(tool_call), timeout)
+                except asyncio.TimeoutError:
+                    return self._tool_timeout_message(tool_call, timeout)
+                except Exception as e:
+                    return self._tool_error_message(tool_call.id, tool_call.function.name, e)
+        
+        # gather keeps the original tool_call order, and tasks inherit the span context
+        messages.extend(await asyncio.gather(*(run(tool_call) for tool_call in response.choices[0].message.tool_calls)))
+        return messages
+    
+    @tracer.chain(name="route_request")
+    @metrics.timed(metrics.STAGE_SECONDS, stage="route_request")
+    async def get_openai_response_async(self, messages):
+        tool_call = self._pre_route(messages)
+        if tool_call is not None:
+            messages.append(self._assistant_message(
+                None, [(tool_call.id, tool_call.function.name, tool_call.function.arguments)]
+            ))
+            try:
+                messages.append(await self._process_tool_call_async(tool_call))
+            except Exception as e:
+                messages.append(self._tool_error_message(tool_call.id, tool_call.function.name, e))
+            return messages
+        
+        router_prompt = await prompts.get_prompt_async("travel-agent-router")
+        prompt_messages, kwargs = self._build_router_request(router_prompt, messages)
+        
+        with metrics.timed(metrics.STAGE_SECONDS, stage="router_llm"):
+            response = await clients.async_openai_client().chat.completions.create(
+                messages=prompt_messages,
+                **kwargs
+            )
+        metrics.record_tokens("router", response.usage)
+        
+        message = response.choices[0].message
+        messages.append(self._assistant_message(message.content, [
+            (tool_call.id, tool_call.function.name, tool_call.function.arguments)
+            for tool_call in message.tool_calls or []
+        ]))
+        
+        if response.choices[0].message.tool_calls:
+            messages = await self.process_tool_calls_async(response, messages)
+            
+        return messages
+    
+    @tracer.agent(name="invoke_agent")
+    async def respond_async(self, user_input):
+        if not user_input.strip():
+            return "Please enter a message."
+        
+        # Lets flight tools keep and refine this conversation's results
+        flights.bind_session(self.flight_session)
+        self.history.add_message("user", user_input)
+        
+        messages = self.history.get_history()
+        try:
+            messages = await self.get_openai_response_async(messages)
+        except BaseException as e:
+            # The history outlives this turn; don't leave it with unanswered tool calls
+            self._answer_unanswered_tool_calls(messages, e)
+            raise
+        assistant_response = self._last_response(messages)
+        
+        # compact may call the summarizer, so keep it off the event loop
+        await asyncio.to_thread(self.history.compact)
+        return assistant_response
+    
+    async def respond_stream_async(self, user_input):
+        """
+        Streaming variant of respond_async. Yields the reply in chunks as the router (for
+        direct answers) or the tools' completions produce them.
+        """
+        if not user_input.strip():
+            yield "Please enter a message."
+            return
+        
+        # Lets flight tools keep and refine this conversation's results
+        flights.bind_session(self.flight_session)
+        self.history.add_message("user", user_input)
+        messages = self.history.get_history()
+        
+        with tracer.start_as_current_span("invoke_agent", openinference_span_kind="agent") as span:
+            span.set_input(user_input)
+            # Covers routing and the tool calls, like route_request in the non-streaming path
+            with metrics.timed(metrics.STAGE_SECONDS, stage="route_request"):
+                tool_call = self._pre_route(messages)
+                if tool_call is not None:
+                    content = []
+                    tool_calls = {0: {"id": tool_call.id, "name": tool_call.function.name,
+                                      "arguments": tool_call.function.arguments}}
+                else:
+                    router_prompt = await prompts.get_prompt_async("travel-agent-router")
+                    prompt_messages, kwargs = self._build_router_request(router_prompt, messages)
+            
+                    content, tool_calls = [], {}
+                    with metrics.timed(metrics.STAGE_SECONDS, stage="router_llm"):
+                        stream = await clients.async_openai_client().chat.completions.create(
+                            messages=prompt_messages, stream=True, stream_options={"include_usage": True}, **kwargs
+                        )
+                        async for chunk in stream:
+                            if chunk.usage:
+                                metrics.record_tokens("router", chunk.usage)
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta
+                            if delta.content:
+                                content.append(delta.content)
+                                yield delta.content
+                            if delta.tool_calls:
+                                _collect_tool_call_deltas(delta.tool_calls, tool_calls)
+                messages.append(self._assistant_message("".join(content) or None, [
+                    (tool_call["id"], tool_call["name"], tool_call["arguments"])
+                    for _, tool_call in sorted(tool_calls.items())
+                ]))
+            
+                try:
+                    async for part in self._stream_tool_calls_async(
+                        [tool_call for _, tool_call in sorted(tool_calls.items())], messages
+                    ):
+                        yield part
+                except BaseException as e:
+                    # Also when the client goes away mid-stream: the history outlives this turn
+                    self._answer_unanswered_tool_calls(messages, e)
+                    raise
+            
+            span.set_output(self._last_response(messages))
+        await asyncio.to_thread(self.history.compact)
 
-# Initialize the bot
-travel_bot = TravelAgentBot()
+# One bot per Gradio session, evicted when idle or over the memory budget
+sessions = SessionStore(
+    AsyncTravelAgentBot,
+    max_sessions=int(os.getenv("MAX_SESSIONS", "1000")),
+    idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", "1800")),
+    max_total_chars=int(os.getenv("SESSION_MAX_TOTAL_CHARS", "20000000")),
+    # Shared by every worker process when set, so any of them can answer any session
+    store=conversation_store.make_store(os.getenv("CONVERSATION_STORE"),
+                                        ttl=float(os.getenv("CONVERSATION_TTL", "604800"))),
+)
 
-# Define the Gradio interface
-def respond_to_user(message, history):
-    with using_session(session_id):
-        bot_response = travel_bot.respond(message)
-        return "", history + [[message, bot_response]]
+async def get_session(key):
+    if sessions.store is None:
+        return sessions.get(key)
+    return await asyncio.to_thread(sessions.get, key)
 
-def clear_chat_history():
-    return travel_bot.clear_history()
+async def save_session(key, travel_bot):
+    # Without a store this only records the session's new size, so it stays on the event loop
+    if sessions.store is None:
+        sessions.save(key, travel_bot)
+    else:
+        await asyncio.to_thread(sessions.save, key, travel_bot)
 
-# Create the Gradio interface
-with gr.Blocks(css="footer {visibility: hidden}") as demo:
-    gr.Markdown("# Travel Agent Chatbot")
-    gr.Markdown("Ask me about destinations, travel tips, or help planning your next vacation!")
+SAVE_FAILED_NOTE = "\n\n(I couldn't save this reply, so I may not remember it next time.)"
+
+async def _save_turn(key, travel_bot):
+    """Saves the conversation after a turn; returns False, after logging why, if that failed."""
+    try:
+        await save_session(key, travel_bot)
+        return True
+    except Exception:
+        logger.exception("Couldn't save conversation %s", key)
+        return False
+
+# Caps concurrent requests, rate-limits each client and sheds load once the queue is full or slow
+admission_controller = admission.AdmissionController() if ADMISSION_ENABLED else None
+
+async def respond_to_user(message, history, request):
+    started = time.perf_counter()
+    if admission_controller is not None:
+        # Conversations already under way go ahead of new ones in the queue
+        rejection = await admission_controller.acquire(admission.client_key(request), priority=0 if history else 1)
+        if rejection is not None:
+            metrics.REQUESTS.inc(status="rejected")
+            yield "", history + [[message, admission.BUSY_MESSAGES[rejection]]]
+            return
     
-    chatbot = gr.Chatbot(
-        [],
-        elem_id="chatbot",
-        avatar_images=(None, "https://img.icons8.com/color/96/000000/tourist-male--v1.png")
-        # Removed 'type="messages"' which was causing the error
-    )
+    travel_bot = None
+    saved = False
+    metrics.IN_FLIGHT.inc()
+    status = "error"
+    try:
+        # Inside the try: a store that fails or a cancelled load must still release the admission slot
+        travel_bot = await get_session(request.session_hash)
+        with using_session(travel_bot.session_id):
+            if not STREAM_RESPONSES:
+                bot_response = await travel_bot.respond_async(message)
+                status = "ok"
+                saved = True
+                if not await _save_turn(request.session_hash, travel_bot):
+                    status = "save_error"
+                    bot_response += SAVE_FAILED_NOTE
+                yield "", history + [[message, bot_response]]
+                return
+            
+            history = history + [[message, ""]]
+            async for chunk in travel_bot.respond_stream_async(message):
+                if not history[-1][1]:
+                    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="first_chunk")
+                history[-1][1] += chunk
+                yield "", history
+            status = "ok"
+            saved = True
+            if not await _save_turn(request.session_hash, travel_bot):
+                status = "save_error"
+                history[-1][1] += SAVE_FAILED_NOTE
+                yield "", history
+    finally:
+        try:
+            # Failed or cancelled turns still keep what they added to the history
+            if travel_bot is not None and not saved:
+                await _save_turn(request.session_hash, travel_bot)
+        finally:
+            if admission_controller is not None:
+                admission_controller.release()
+            metrics.IN_FLIGHT.dec()
+            metrics.REQUESTS.inc(status=status)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="request")
+
+async def clear_chat_history(request):
+    travel_bot = await get_session(request.session_hash)
+    result = travel_bot.clear_history()
+    await save_session(request.session_hash, travel_bot)
+    return result
+
+def build_demo():
+    """Builds the Gradio interface. Gradio is imported here: it takes longer to import than everything else."""
+    import gradio as gr
     
-    with gr.Row():
-        msg = gr.Textbox(
-            placeholder="Where should I travel this summer?",
-            container=False,
-            scale=9,
+    # Gradio passes the request to handlers annotated with gr.Request
+    async def respond(message, history, request: gr.Request):
+        async for update in respond_to_user(message, history, request):
+            yield update
+    
+    async def clear_chat(request: gr.Request):
+        return await clear_chat_history(request)
+    
+    with gr.Blocks(css="footer {visibility: hidden}") as demo:
+        gr.Markdown("# Travel Agent Chatbot")
+        gr.Markdown("Ask me about destinations, travel tips, or help planning your next vacation!")
+    
+        chatbot = gr.Chatbot(
+            [],
+            elem_id="chatbot",
+            avatar_images=(None, "https://img.icons8.com/color/96/000000/tourist-male--v1.png")
+            # Removed 'type="messages"' which was causing the error
         )
-        submit = gr.Button("Send", scale=1)
     
-    clear = gr.Button("Clear conversation")
+        with gr.Row():
+            msg = gr.Textbox(
+                placeholder="Where should I travel this summer?",
+                container=False,
+                scale=9,
+            )
+            submit = gr.Button("Send", scale=1)
     
-    # Set up event handlers
-    msg.submit(respond_to_user, [msg, chatbot], [msg, chatbot])
-    submit.click(respond_to_user, [msg, chatbot], [msg, chatbot])
-    clear.click(clear_chat_history, None, None)
-    clear.click(lambda: [], None, chatbot)
-    clear.click(lambda: "", None, msg)
+        clear = gr.Button("Clear conversation")
+    
+        # Set up event handlers
+        msg.submit(respond, [msg, chatbot], [msg, chatbot])
+        submit.click(respond, [msg, chatbot], [msg, chatbot])
+        clear.click(clear_chat, None, None)
+        clear.click(lambda: [], None, chatbot)
+        clear.click(lambda: "", None, msg)
+    return demo
+
+def __getattr__(name):
+    # `main.demo` still works (e.g. for `gradio main.py`), built on first access
+    if name == "demo":
+        global demo
+        demo = build_demo()
+        return demo
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up():
+    """
+    Does the start-up work deferred from import so the first request doesn't
+    pay for it: tracing, the OpenAI clients and, with PROMPT_PREFETCH, the prompts.
+    """
+    tracer.setup()
+    clients.openai_client()
+    clients.async_openai_client()
+    if prompts.PROMPT_PREFETCH:
+        prompts.prefetch_prompts()
 
 if __name__ == "__main__":
-    demo.launch(server_name="0.0.0.0", server_port=7860)
+    warm_up()
+    demo = build_demo()
+    if metrics.METRICS_ENABLED:
+        metrics.start_http_server(int(os.getenv("METRICS_PORT", "9464")))
+    # Handlers are async, so one process can keep many conversations in flight
+    demo.queue(default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY_LIMIT", "200")))
+    # Run one process per core on consecutive ports behind a load balancer with a shared CONVERSATION_STORE
+    demo.launch(server_name="0.0.0.0", server_port=int(os.getenv("GRADIO_SERVER_PORT", "7860")))
     # print(travel_bot.respond("What is the weather in Tokyo?"))
     # print(travel_bot.respond("What are the best places to visit in Tokyo?"))
@@ -0,0 +1,209 @@
+import csv
+import json
+import math
+import os
+import re
+import uuid
+from collections import Counter as TokenCounter
+from types import SimpleNamespace
+
+import metrics
+
+PRE_ROUTER_ENABLED = os.getenv("PRE_ROUTER_ENABLED", "false").lower() == "true"
+PRE_ROUTER_THRESHOLD = float(os.getenv("PRE_ROUTER_THRESHOLD", "0.85"))
+# A clause classified at least this confidently as a different tool makes the message multi-intent
+PRE_ROUTER_CLAUSE_THRESHOLD = float(os.getenv("PRE_ROUTER_CLAUSE_THRESHOLD", "0.5"))
+TRAINING_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  "generated_questions", "test_router_functions.csv")
+
+NO_TOOL = "no tool call"
+
+# A few hand-written examples per intent on top of the generated router questions
+SEED_EXAMPLES = [
+    ("flights from JFK to LAX on 2025-06-01", "flight_search"),
+    ("find me a flight from SFO to LIS", "flight_search"),
+    ("book flights departing 2025-07-04 returning 2025-07-10", "flight_search"),
+    ("one way flight to Tokyo", "flight_search"),
+    ("plan an itinerary for Rome from 2025-05-01 to 2025-05-05", "create_itinerary"),
+    ("make me a day by day plan for my trip", "create_itinerary"),
+    ("schedule of activities for each day of my vacation", "create_itinerary"),
+    ("what should I pack for Iceland from 2025-01-10 to 2025-01-17", "create_packing_list"),
+    ("packing list for a beach trip", "create_packing_list"),
+    ("what clothes should I bring", "create_packing_list"),
+    ("tell me about Lisbon", "get_travel_info"),
+    ("what are the best attractions in Kyoto", "get_travel_info"),
+    ("travel tips and information for Cairo", "get_travel_info"),
+    ("hi", NO_TOOL),
+    ("thanks that's great", NO_TOOL),
+    ("what can you do", NO_TOOL),
+    ("can you make it cheaper", NO_TOOL),
+    ("what about the second option", NO_TOOL),
+]
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+
+_ISO_DATE = r"\d{4}-\d{2}-\d{2}"
+_WRITTEN_DATE = r"(?:" + "|".join(m.capitalize() for m in MONTHS) + r")\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4}"
+_DATE = re.compile(rf"({_ISO_DATE}|{_WRITTEN_DATE})")
+_ROUTE = re.compile(r"\b([A-Z]{3})\s*(?:to|->|→|-)\s*([A-Z]{3})\b")
+# Sentence ends and conjunctions that can join separate requests in one message
+_CLAUSE_BREAK = re.compile(
+    r"[.?!;]+\s+|,?\s+\b(?:and\s+also|and\s+then|as\s+well\s+as|in\s+addition|additionally|also|plus|then|and)\b\s*",
+    re.IGNORECASE,
+)
+_PLACE = re.compile(r"\b(?:to|in|for|visit|visiting|about|at)\s+([A-Z][\w'\-]+(?:\s+[A-Z][\w'\-]+)*)")
+
+
+def _features(text):
+    tokens = re.findall(r"[a-z]+", text.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def split_clauses(text):
+    """Splits a message at sentence ends and conjunctions; clauses of a single word are dropped."""
+    return [clause for clause in _CLAUSE_BREAK.split(text) if len(re.findall(r"[a-z]+", clause.lower())) > 1]
+
+
+def _iso_date(value):
+    match = re.fullmatch(r"([A-Za-z]+)\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})", value)
+    if not match:
+        return value
+    return f"{match.group(3)}-{MONTHS.index(match.group(1).lower()) + 1:02d}-{int(match.group(2)):02d}"
+
+
+def extract_dates(text):
+    return [_iso_date(value) for value in _DATE.findall(text)]
+
+
+def extract_route(text):
+    match = _ROUTE.search(text)
+    return (match.group(1), match.group(2)) if match else None
+
+
+def extract_place(text):
+    for match in _PLACE.finditer(text):
+        words = match.group(1).split()
+        # "to Paris in June" -> stop at month names
+        while words and words[-1].lower() in MONTHS:
+            words.pop()
+        if words and words[0].lower() not in MONTHS:
+            return " ".join(words)
+    return None
+
+
+class IntentClassifier:
+    """
+    Multinomial naive Bayes over word unigrams and bigrams. Small and fast
+    enough to run on every message before the LLM router.
+    """
+
+    def __init__(self, examples):
+        self.label_counts = TokenCounter()
+        self.feature_counts = {}
+        self.vocabulary = set()
+        for text, label in examples:
+            features = _features(text)
+            self.label_counts[label] += 1
+            self.feature_counts.setdefault(label, TokenCounter()).update(features)
+            self.vocabulary.update(features)
+        self.totals = {label: sum(counts.values()) for label, counts in self.feature_counts.items()}
+
+    def predict(self, text):
+        """Returns (label, probability) for the most likely intent."""
+        features = [f for f in _features(text) if f in self.vocabulary]
+        total_examples = sum(self.label_counts.values())
+        scores = {}
+        for label, count in self.label_counts.items():
+            counts, total = self.feature_counts[label], self.totals[label]
+            scores[label] = math.log(count / total_examples) + sum(
+                math.log((counts[f] + 1) / (total + len(self.vocabulary))) for f in features
+            )
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1 / normalizer
+
+
+def load_examples(path=TRAINING_DATA_PATH):
+    examples = list(SEED_EXAMPLES)
+    try:
+        with open(path, newline="") as f:
+            examples += [(row["question"], row["expected_output"]) for row in csv.DictReader(f)]
+    except (OSError, KeyError):
+        pass
+    return examples
+
+
+class PreRouter:
+    """
+    Dispatches obvious requests straight to a tool, skipping the LLM router.
+
+    A request is dispatched only when the classifier is at least `threshold`
+    confident in one tool and rule-based extraction finds every required
+    argument (IATA route and dates for flights; a destination, plus check-in
+    and check-out dates where needed). Messages asking for more than one thing
+    ("tell me about Paris and also find flights ...") would lose everything
+    but the first request, so they are detected by classifying each clause and
+    left to the LLM router, which can call several tools. Everything else
+    returns None and falls back to the LLM router too.
+    """
+
+    def __init__(self, classifier=None, threshold=PRE_ROUTER_THRESHOLD,
+                 clause_threshold=PRE_ROUTER_CLAUSE_THRESHOLD):
+        self.classifier = classifier or IntentClassifier(load_examples())
+        self.threshold = threshold
+        self.clause_threshold = clause_threshold
+
+    def _multi_intent(self, tool_name, text):
+        """True if some clause of `text` confidently asks for a different tool than `tool_name`."""
+        clauses = split_clauses(text)
+        if len(clauses) < 2:
+            return False
+        for clause in clauses:
+            label, probability = self.classifier.predict(clause)
+            if label not in (NO_TOOL, tool_name) and probability >= self.clause_threshold:
+                return True
+        return False
+
+    def _arguments(self, tool_name, text):
+        dates = extract_dates(text)
+        if tool_name == "flight_search":
+            route = extract_route(text)
+            if not route or not dates or len(dates) > 2:
+                return None
+            return {"origin": route[0], "destination": route[1],
+                    "departure_date": dates[0], "return_date": dates[1] if len(dates) > 1 else None}
+
+        destination = extract_place(text)
+        if not destination:
+            return None
+        if tool_name == "get_travel_info":
+            return {"destination": destination} if not dates else None
+        if tool_name in ("create_itinerary", "create_packing_list") and len(dates) == 2:
+            return {"destination": destination, "checkin_date": dates[0], "checkout_date": dates[1]}
+        return None
+
+    def route(self, text):
+        """Returns a tool call (shaped like the OpenAI SDK's) or None to fall back to the LLM router."""
+        tool_name, probability = self.classifier.predict(text)
+        arguments = None
+        if tool_name != NO_TOOL and probability >= self.threshold:
+            if self._multi_intent(tool_name, text):
+                PRE_ROUTER_DECISIONS.inc(outcome="multi_intent")
+                return None
+            arguments = self._arguments(tool_name, text)
+        if arguments is None:
+            PRE_ROUTER_DECISIONS.inc(outcome="fallback")
+            return None
+
+        PRE_ROUTER_DECISIONS.inc(outcome="dispatched", tool=tool_name)
+        return SimpleNamespace(
+            id=f"call_pre_{uuid.uuid4().hex[:20]}",
+            type="function",
+            function=SimpleNamespace(name=tool_name, arguments=json.dumps(arguments)),
+        )
+
+
+PRE_ROUTER_DECISIONS = metrics.Counter("travel_agent_pre_router_total",
+                                       "Local pre-router decisions: dispatched to a tool, or fell back to the LLM "
+                                       "(multi_intent for messages asking for several things).")
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+
+class PromptCache:
+    """
+    In-process cache of Phoenix prompts keyed by prompt identifier.
+
+    Fresh entries are served straight from memory. Once an entry is older than
+    `ttl` seconds it is still served, and a background thread refreshes it from
+    Phoenix. `aget` serves the same entries to async callers, using `afetch`
+    (when given) for the initial fetch. Identifiers listed in `pinned_versions` are fetched once by version
+    id and never refreshed. When `snapshot_path` is set, every fetched prompt is
+    written to disk so a cold start can serve prompts before Phoenix answers;
+    the snapshot is read on the first lookup rather than at construction.
+    """
+
+    def __init__(self, fetch, ttl=300, snapshot_path=None, pinned_versions=None, afetch=None):
+        self._fetch = fetch
+        self._afetch = afetch
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.pinned_versions = dict(pinned_versions or {})
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._snapshot_loaded = not snapshot_path
+
+    def get(self, prompt_identifier):
+        self._ensure_snapshot()
+        with self._lock:
+            entry = self._entries.get(prompt_identifier)
+        if entry is None:
+            return self._refresh(prompt_identifier)
+
+        prompt, fetched_at = entry
+        if prompt_identifier in self.pinned_versions and fetched_at:
+            return prompt
+        if time.monotonic() - fetched_at > self.ttl:
+            self._refresh_in_background(prompt_identifier)
+        return prompt
+
+    async def aget(self, prompt_identifier):
+        self._ensure_snapshot()
+        with self._lock:
+            cached = prompt_identifier in self._entries
+        if cached:
+            # Cached lookups never block: stale entries refresh on a thread.
+            return self.get(prompt_identifier)
+        if self._afetch is None:
+            return await asyncio.to_thread(self._refresh, prompt_identifier)
+        prompt = await self._afetch(prompt_identifier, self.pinned_versions.get(prompt_identifier))
+        self._store(prompt_identifier, prompt)
+        return prompt
+
+    def warm(self, prompt_identifiers):
+        for prompt_identifier in prompt_identifiers:
+            try:
+                self.get(prompt_identifier)
+            except Exception:
+                pass
+
+    def invalidate(self, prompt_identifier=None):
+        with self._lock:
+            if prompt_identifier is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(prompt_identifier, None)
+
+    def _refresh(self, prompt_identifier):
+        prompt = self._fetch(prompt_identifier, self.pinned_versions.get(prompt_identifier))
+        self._store(prompt_identifier, prompt)
+        return prompt
+
+    def _store(self, prompt_identifier, prompt):
+        with self._lock:
+            self._entries[prompt_identifier] = (prompt, time.monotonic())
+        if self.snapshot_path:
+            self._save_snapshot()
+
+    def _refresh_in_background(self, prompt_identifier):
+        with self._lock:
+            if prompt_identifier in self._refreshing:
+                return
+            self._refreshing.add(prompt_identifier)
+
+        def run():
+            try:
+                self._refresh(prompt_identifier)
+            except Exception:
+                # Keep serving the stale prompt; the next lookup retries.
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(prompt_identifier)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _ensure_snapshot(self):
+        if self._snapshot_loaded:
+            return
+        with self._lock:
+            if not self._snapshot_loaded and self.snapshot_path:
+                self._load_snapshot()
+            self._snapshot_loaded = True
+
+    def _load_snapshot(self):
+        from phoenix.client.types import PromptVersion
+
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return
+        for prompt_identifier, data in snapshot.items():
+            try:
+                prompt = PromptVersion._loads(data)
+            except Exception:
+                continue
+            # A fetched_at of 0 marks the entry stale so it is refreshed on first use.
+            self._entries[prompt_identifier] = (prompt, 0)
+
+    def _save_snapshot(self):
+        with self._lock:
+            snapshot = {
+                prompt_identifier: {"id": prompt.id, **prompt._dumps()}
+                for prompt_identifier, (prompt, _) in self._entries.items()
+            }
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except (OSError, TypeError, ValueError):
+            pass
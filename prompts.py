@@ -1,18 +1,64 @@
-from phoenix.client import Client
-from phoenix.client.types import PromptVersion
-from openai.types.chat.completion_create_params import CompletionCreateParamsBase
+import os
+import threading
+import clients
+import metrics
 import tools
+from prompt_cache import PromptCache
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = Client()
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", "300"))
+PROMPT_PREFETCH = os.getenv("PROMPT_PREFETCH", "false").lower() == "true"
+PROMPT_SNAPSHOT_PATH = os.getenv(
+    "PROMPT_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".prompt_cache.json")
+)
 
+def _parse_version_pins(value):
+    # "travel-agent-router=UHJvbXB0VmVyc2lvbjox,travel-agent-info=..."
+    pins = {}
+    for item in value.split(","):
+        if "=" in item:
+            prompt_identifier, version_id = item.split("=", 1)
+            pins[prompt_identifier.strip()] = version_id.strip()
+    return pins
+
+def _fetch_prompt(prompt_identifier, prompt_version_id=None):
+    if prompt_version_id:
+        return clients.phoenix_client().prompts.get(prompt_version_id=prompt_version_id)
+    return clients.phoenix_client().prompts.get(prompt_identifier=prompt_identifier)
+
+async def _fetch_prompt_async(prompt_identifier, prompt_version_id=None):
+    if prompt_version_id:
+        return await clients.async_phoenix_client().prompts.get(prompt_version_id=prompt_version_id)
+    return await clients.async_phoenix_client().prompts.get(prompt_identifier=prompt_identifier)
+
+prompt_cache = PromptCache(
+    _fetch_prompt,
+    ttl=PROMPT_CACHE_TTL,
+    snapshot_path=PROMPT_SNAPSHOT_PATH or None,
+    pinned_versions=_parse_version_pins(os.getenv("PROMPT_VERSION_PINS", "")),
+    afetch=_fetch_prompt_async,
+)
+
+@metrics.timed(metrics.STAGE_SECONDS, stage="prompt_fetch")
 def get_prompt(prompt_identifier):
-    return client.prompts.get(prompt_identifier=prompt_identifier)
+    return prompt_cache.get(prompt_identifier)
 
-def create_router_prompt():
-    params = CompletionCreateParamsBase(
+@metrics.timed(metrics.STAGE_SECONDS, stage="prompt_fetch")
+async def get_prompt_async(prompt_identifier):
+    return await prompt_cache.aget(prompt_identifier)
+
+def _prompt_version(params):
+    # The Phoenix client is only needed to create prompts, so it isn't imported up front
+    from phoenix.client.types import PromptVersion
+
+    return PromptVersion.from_openai(params)
+
+# The *_params functions return OpenAI CompletionCreateParams; that TypedDict is a
+# plain dict at runtime and importing it would pull in all of openai.types.
+def router_prompt_params():
+    return dict(
         model="gpt-4o-mini",
         tools=tools.get_tools(),
         messages=[
@@ -23,14 +69,15 @@ def create_router_prompt():
         ]
     )
     
-    client.prompts.create(
+def create_router_prompt():
+    clients.phoenix_client().prompts.create(
         name="travel-agent-router",
         prompt_description="A router prompt for the travel agent.",
-        version=PromptVersion.from_openai(params)
+        version=_prompt_version(router_prompt_params())
     )
     
-def create_itinerary_prompt():
-    params = CompletionCreateParamsBase(
+def itinerary_prompt_params():
+    return dict(
         model="gpt-4o-mini",
         messages=[
             {
@@ -39,19 +86,20 @@ def create_itinerary_prompt():
             },
             {
                 "role": "user",
-                "content": "Destination: {{destination}} \n Check In Date: {{checkin_date}} \n Check Out Date: {{checkout_date}} \n Budget: {{budget}} \n Interests: {{interests}}"
+                "content": "Destination: {{destination}} \n Check In Date: {{checkin_date}} \n Check Out Date: {{checkout_date}}"
             }
         ]
     )
     
-    client.prompts.create(
+def create_itinerary_prompt():
+    clients.phoenix_client().prompts.create(
         name="travel-agent-itinerary",
         prompt_description="A prompt for the travel agent to create an itinerary.",
-        version=PromptVersion.from_openai(params)
+        version=_prompt_version(itinerary_prompt_params())
     )
     
-def create_packing_list_prompt():
-    params = CompletionCreateParamsBase(
+def packing_list_prompt_params():
+    return dict(
         model="gpt-4o-mini",
         messages=[
             {
@@ -60,19 +108,20 @@ def create_packing_list_prompt():
             },
             {
                 "role": "user",
-                "content": "Destination: {{destination}} \n Check In Date: {{checkin_date}} \n Check Out Date: {{checkout_date}} \n Budget: {{budget}} \n Interests: {{interests}}"
+                "content": "Destination: {{destination}} \n Check In Date: {{checkin_date}} \n Check Out Date: {{checkout_date}}"
             }
         ]
     )
     
-    client.prompts.create(
+def create_packing_list_prompt():
+    clients.phoenix_client().prompts.create(
         name="travel-agent-packing",
         prompt_description="A prompt for the travel agent to create a packing list.",
-        version=PromptVersion.from_openai(params)
+        version=_prompt_version(packing_list_prompt_params())
     )
     
-def create_info_prompt():
-    params = CompletionCreateParamsBase(
+def info_prompt_params():
+    return dict(
         model="gpt-4o-mini",
         messages=[
             {
@@ -86,12 +135,27 @@ def create_info_prompt():
         ]
     )
     
-    client.prompts.create(
+def create_info_prompt():
+    clients.phoenix_client().prompts.create(
         name="travel-agent-info",
         prompt_description="A prompt for the travel agent to provide information about a destination.",
-        version=PromptVersion.from_openai(params)
+        version=_prompt_version(info_prompt_params())
     )
 
+# Prompt identifier -> the OpenAI parameters its version is created from
+PROMPT_PARAMS = {
+    "travel-agent-router": router_prompt_params,
+    "travel-agent-itinerary": itinerary_prompt_params,
+    "travel-agent-packing": packing_list_prompt_params,
+    "travel-agent-info": info_prompt_params,
+}
+
+def prefetch_prompts():
+    """Fetches every prompt the agent uses on a background thread, so the first request finds them cached."""
+    thread = threading.Thread(target=prompt_cache.warm, args=(list(PROMPT_PARAMS),), daemon=True)
+    thread.start()
+    return thread
+
 if __name__ == "__main__":
     create_router_prompt()
     create_itinerary_prompt()
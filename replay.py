@@ -0,0 +1,461 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+
+import clients
+import pre_router
+
+# Query parameters that are credentials rather than part of the request
+REDACTED_PARAMS = {"api_key"}
+
+# Arguments the stand-in router uses when the question doesn't contain them
+DEFAULT_TOOL_ARGS = {
+    "origin": "SFO",
+    "destination": "LIS",
+    "departure_date": "2025-06-06",
+    "return_date": "2025-06-13",
+    "checkin_date": "2025-06-06",
+    "checkout_date": "2025-06-13",
+    "origins": ["SFO"],
+    "destinations": ["LIS", "BCN"],
+    "earliest_departure_date": "2025-06-06",
+    "latest_departure_date": "2025-06-08",
+}
+
+
+def upstream(request):
+    host = request.url.host
+    if "openai" in host:
+        return "openai"
+    if "serpapi" in host:
+        return "serpapi"
+    return "phoenix"
+
+
+def _body(request):
+    try:
+        content = request.content
+    except httpx.RequestNotRead:
+        content = request.read()
+    try:
+        return json.loads(content) if content else None
+    except ValueError:
+        return content.decode(errors="replace")
+
+
+def _url(request):
+    query = sorted((k, v) for k, v in parse_qsl(request.url.query.decode()) if k not in REDACTED_PARAMS)
+    url = f"{request.url.scheme}://{request.url.host}{request.url.path}"
+    return f"{url}?{urlencode(query)}" if query else url
+
+
+def request_key(request):
+    """Stable key for a request: method, URL without credentials and canonical JSON body."""
+    body = json.dumps(_body(request), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{request.method} {_url(request)} {body}".encode()).hexdigest()
+
+
+def load_recordings(path):
+    recordings = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                recording = json.loads(line)
+                recordings[recording["key"]] = recording
+    return recordings
+
+
+class RecordingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    Passes requests through to the real upstreams and appends each request and
+    response pair to `path` as JSONL, for ReplayTransport. Credentials are not
+    recorded. Responses are read in full before they are returned, so streamed
+    responses arrive all at once while recording.
+    """
+
+    def __init__(self, path, transport=None, async_transport=None):
+        self.path = path
+        self.transport = transport or httpx.HTTPTransport()
+        self.async_transport = async_transport or httpx.AsyncHTTPTransport()
+        self._lock = threading.Lock()
+
+    def _record(self, request, response, content, elapsed):
+        recording = {
+            "key": request_key(request),
+            "method": request.method,
+            "url": _url(request),
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", "application/json"),
+            "body": content.decode(errors="replace"),
+            "elapsed": elapsed,
+        }
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(recording) + "\n")
+        return httpx.Response(response.status_code, headers={"content-type": recording["content_type"]},
+                              content=content, request=request)
+
+    def handle_request(self, request):
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        return self._record(request, response, content, time.perf_counter() - started)
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        response = await self.async_transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        return self._record(request, response, content, time.perf_counter() - started)
+
+    def close(self):
+        self.transport.close()
+
+    async def aclose(self):
+        await self.async_transport.aclose()
+
+
+class StandIn:
+    """
+    Deterministic local stand-in for OpenAI and SerpAPI. The same request
+    always gets the same response: the router picks a tool with the
+    pre-router's intent classifier, other completions get filler text sized
+    from the request, embeddings are pseudo-random unit vectors and flight
+    searches return synthetic itineraries. Usage reports prompt tokens as
+    cached when the same tools and leading messages were seen before, like a
+    provider's prefix cache.
+    """
+
+    def __init__(self, classifier=None, completion_words=(40, 160), max_prefixes=100_000):
+        self.classifier = classifier or pre_router.IntentClassifier(pre_router.load_examples())
+        self.completion_words = completion_words
+        self.max_prefixes = max_prefixes
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        """Returns (status, content_type, body) for `request`."""
+        rng = random.Random(request_key(request))
+        body = _body(request)
+        path = request.url.path
+        if upstream(request) == "serpapi":
+            return 200, "application/json", json.dumps(self._flights(rng, dict(parse_qsl(request.url.query.decode()))))
+        if path.endswith("/embeddings"):
+            return 200, "application/json", json.dumps(self._embeddings(rng, body))
+        if path.endswith("/chat/completions"):
+            message = self._message(rng, body)
+            if body.get("stream"):
+                return 200, "text/event-stream", self._stream(rng, body, message)
+            return 200, "application/json", json.dumps(self._completion(body, message))
+        return 404, "application/json", json.dumps({"error": f"No stand-in for {request.method} {path}"})
+
+    def _message(self, rng, body):
+        messages = body.get("messages", [])
+        question = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        tools = {t["function"]["name"]: t["function"] for t in body.get("tools", [])}
+        if tools:
+            tool_name, _ = self.classifier.predict(question)
+            if tool_name in tools:
+                return {"role": "assistant", "content": None, "tool_calls": [{
+                    "id": f"call_{rng.getrandbits(64):016x}",
+                    "type": "function",
+                    "function": {"name": tool_name, "arguments": json.dumps(self._arguments(tools[tool_name], question))},
+                }]}
+        words = rng.randint(*self.completion_words)
+        filler = " ".join(rng.choice(("travel", "city", "museum", "beach", "food", "weather", "hotel", "train"))
+                          for _ in range(words))
+        return {"role": "assistant", "content": f"Stand-in answer to: {question[:80]}\n\n{filler}"}
+
+    @staticmethod
+    def _arguments(function, question):
+        dates = pre_router.extract_dates(question)
+        route = pre_router.extract_route(question)
+        extracted = {
+            "destination": route[1] if route else pre_router.extract_place(question),
+            "origin": route[0] if route else None,
+            "departure_date": dates[0] if dates else None,
+            "checkin_date": dates[0] if dates else None,
+            "checkout_date": dates[1] if len(dates) > 1 else None,
+            "return_date": dates[1] if len(dates) > 1 else None,
+        }
+        parameters = function["parameters"]
+        return {name: extracted.get(name) or DEFAULT_TOOL_ARGS.get(name, "")
+                for name in parameters.get("required", [])}
+
+    def _cached_chars(self, body):
+        # Length of the longest prefix (tools, then messages) seen in an earlier request
+        digest = hashlib.sha256(json.dumps(body.get("tools"), sort_keys=True).encode())
+        chars = cached = 0
+        with self._lock:
+            if len(self._prefixes) > self.max_prefixes:
+                self._prefixes.clear()
+            for message in body.get("messages", []):
+                digest.update(json.dumps(message, sort_keys=True).encode())
+                chars += len(str(message.get("content") or ""))
+                prefix = digest.hexdigest()
+                if prefix in self._prefixes:
+                    cached = chars
+                else:
+                    self._prefixes.add(prefix)
+        return cached
+
+    def _usage(self, body, message):
+        prompt_chars = sum(len(str(m.get("content") or "")) for m in body.get("messages", []))
+        completion_chars = len(message.get("content") or json.dumps(message.get("tool_calls")))
+        prompt_tokens, completion_tokens = prompt_chars // 4 + 1, completion_chars // 4 + 1
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": self._cached_chars(body) // 4}}
+
+    def _completion(self, body, message):
+        return {
+            "id": "chatcmpl-standin",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": self._usage(body, message),
+        }
+
+    def _stream(self, rng, body, message):
+        def chunk(delta, finish_reason=None):
+            return "data: " + json.dumps({
+                "id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": 0,
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        events = [chunk({"role": "assistant", "content": ""})]
+        if message.get("tool_calls"):
+            events += [chunk({"tool_calls": [{"index": i, **tool_call}]})
+                       for i, tool_call in enumerate(message["tool_calls"])]
+            events.append(chunk({}, "tool_calls"))
+        else:
+            words = message["content"].split(" ")
+            events += [chunk({"content": word + " "}) for word in words]
+            events.append(chunk({}, "stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            events.append("data: " + json.dumps({
+                "id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": 0,
+                "model": body.get("model", "gpt-4o-mini"), "choices": [], "usage": self._usage(body, message),
+            }) + "\n\n")
+        return "".join(events) + "data: [DONE]\n\n"
+
+    @staticmethod
+    def _embeddings(rng, body):
+        inputs = body.get("input", "")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            vector_rng = random.Random(hashlib.sha256(str(text).encode()).digest())
+            vector = [vector_rng.gauss(0, 1) for _ in range(64)]
+            norm = sum(x * x for x in vector) ** 0.5
+            data.append({"object": "embedding", "index": i, "embedding": [x / norm for x in vector]})
+        return {"object": "list", "data": data, "model": body.get("model", ""),
+                "usage": {"prompt_tokens": 1, "total_tokens": 1}}
+
+    @staticmethod
+    def _flights(rng, params):
+        origin, destination = params.get("departure_id", "SFO"), params.get("arrival_id", "LIS")
+        day = params.get("outbound_date", "2025-06-06")
+
+        def itinerary():
+            stops = rng.choice((0, 0, 1, 1, 2))
+            airports = [origin] + [rng.choice(("ORD", "JFK", "LHR", "FRA", "MAD")) for _ in range(stops)] + [destination]
+            legs = [{
+                "airline": rng.choice(("United", "Delta", "TAP", "Iberia", "Lufthansa")),
+                "flight_number": f"XX {rng.randint(100, 9999)}",
+                "departure_airport": {"id": a, "time": f"{day} {rng.randint(6, 21):02d}:00"},
+                "arrival_airport": {"id": b, "time": f"{day} {rng.randint(6, 23):02d}:30"},
+                "duration": rng.randint(60, 720),
+                "airplane": rng.choice(("Airbus A321", "Boeing 787", "Airbus A330")),
+            } for a, b in zip(airports, airports[1:])]
+            layovers = [{"id": a, "duration": rng.randint(45, 300)} for a in airports[1:-1]]
+            return {"flights": legs, "layovers": layovers,
+                    "total_duration": sum(leg["duration"] for leg in legs) + sum(l["duration"] for l in layovers),
+                    "price": rng.randint(150, 1800)}
+
+        return {"best_flights": [itinerary() for _ in range(3)], "other_flights": [itinerary() for _ in range(8)]}
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    Serves recorded responses by request key without touching the network.
+
+    Each response is delayed by `latency[upstream]` seconds when given (e.g.
+    {"openai": 0.8, "serpapi": 1.5}), otherwise by the recorded elapsed time
+    times `latency_scale`; `jitter` spreads delays by up to that fraction
+    either way. Requests with no recording go to `fallback` (a StandIn by
+    default) or get a 404 when it is None.
+    """
+
+    def __init__(self, recordings=None, latency=None, latency_scale=1.0, jitter=0.0, fallback=None, seed=0):
+        self.recordings = recordings or {}
+        self.latency = dict(latency or {})
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _respond(self, request):
+        recording = self.recordings.get(request_key(request))
+        with self._lock:
+            if recording is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            jitter = self._rng.uniform(1 - self.jitter, 1 + self.jitter) if self.jitter else 1.0
+        if recording is not None:
+            status, content_type, body = recording["status"], recording["content_type"], recording["body"]
+            delay = self.latency.get(upstream(request), recording["elapsed"] * self.latency_scale)
+        elif self.fallback is not None:
+            status, content_type, body = self.fallback(request)
+            delay = self.latency.get(upstream(request), 0.0)
+        else:
+            status, content_type = 404, "application/json"
+            body = json.dumps({"error": f"No recording for {request.method} {_url(request)}"})
+            delay = 0.0
+        response = httpx.Response(status, headers={"content-type": content_type}, content=body.encode(), request=request)
+        return response, delay * jitter
+
+    def handle_request(self, request):
+        response, delay = self._respond(request)
+        time.sleep(delay)
+        return response
+
+    async def handle_async_request(self, request):
+        response, delay = self._respond(request)
+        await asyncio.sleep(delay)
+        return response
+
+
+class LocalPrompts:
+    """
+    Stand-in for the Phoenix client's prompts resource, serving the versions
+    prompts.PROMPT_PARAMS would create, with stable local ids.
+    """
+
+    def __init__(self):
+        import prompts
+        from phoenix.client.types import PromptVersion
+
+        self._versions = {}
+        for prompt_identifier, params in prompts.PROMPT_PARAMS.items():
+            version = PromptVersion.from_openai(params())
+            self._versions[prompt_identifier] = PromptVersion._loads(
+                {"id": f"local-{prompt_identifier}", **version._dumps()}
+            )
+
+    def get(self, *, prompt_version_id=None, prompt_identifier=None, tag=None):
+        if prompt_version_id:
+            prompt_identifier = prompt_version_id.removeprefix("local-")
+        return self._versions[prompt_identifier]
+
+
+class AsyncLocalPrompts(LocalPrompts):
+    async def get(self, *, prompt_version_id=None, prompt_identifier=None, tag=None):
+        return LocalPrompts.get(self, prompt_version_id=prompt_version_id, prompt_identifier=prompt_identifier, tag=tag)
+
+
+class LocalPhoenixClient:
+    def __init__(self, prompts):
+        self.prompts = prompts
+
+
+class LocalRedis:
+    """
+    In-process stand-in for the subset of redis.Redis that
+    conversation_store.RedisConversationStore uses. Its one script is run in
+    Python with the same semantics as the Lua original, atomically.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name):
+        value, expires_at = self._values.get(name, (None, None))
+        if expires_at is not None and time.time() >= expires_at:
+            del self._values[name]
+            return None
+        return value
+
+    def _set(self, name, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode()
+        self._values[name] = (value, time.time() + ex if ex else None)
+
+    def get(self, name):
+        with self._lock:
+            return self._get(name)
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._set(name, value, ex)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._values.pop(name, None) is not None for name in names)
+
+    def register_script(self, script):
+        import conversation_store
+
+        if script != conversation_store.SAVE_SCRIPT:
+            raise NotImplementedError("LocalRedis only runs conversation_store.SAVE_SCRIPT")
+
+        def save(keys, args):
+            (key,), (expected, data, ttl) = keys, args
+            with self._lock:
+                current = self._get(key)
+                version = int(current.split(b":", 1)[0]) if current is not None else 0
+                if version != int(expected):
+                    return -1
+                self._set(key, b"%d:" % (version + 1) + data, int(ttl) or None)
+                return version + 1
+
+        return save
+
+
+def record(path):
+    """Routes every upstream call through a RecordingTransport writing to `path`."""
+    transport = RecordingTransport(path)
+    clients.set_transport(transport)
+    return transport
+
+
+def replay(path=None, latency=None, latency_scale=1.0, jitter=0.0, stand_in=True, local_prompts=True, seed=0):
+    """
+    Routes every upstream call through a ReplayTransport over the recordings
+    in `path` (if any), falling back to a StandIn, and serves prompts locally
+    so nothing needs the network. Returns the transport for its hit counts.
+    """
+    import prompts
+
+    transport = ReplayTransport(
+        load_recordings(path) if path else None,
+        latency=latency, latency_scale=latency_scale, jitter=jitter,
+        fallback=StandIn() if stand_in else None, seed=seed,
+    )
+    clients.set_transport(transport)
+    if local_prompts:
+        clients.set_client("phoenix", LocalPhoenixClient(LocalPrompts()))
+        clients.set_client("async_phoenix", LocalPhoenixClient(AsyncLocalPrompts()))
+        # Don't mix local prompts into the snapshot used by real runs
+        prompts.prompt_cache.snapshot_path = None
+        prompts.prompt_cache.invalidate()
+    return transport
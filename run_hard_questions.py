@@ -1,12 +1,109 @@
+import argparse
+import json
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from main import TravelAgentBot
-import pandas as pd
-travel_bot = TravelAgentBot()
+from tracing import using_session
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of `values` for q in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize_latencies(latencies, wall_time):
+    return {
+        "count": len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        "questions_per_second": len(latencies) / wall_time if wall_time else 0.0,
+    }
+
+
+def answer_question(question, max_retries=5, base_delay=1.0):
+    """
+    Answers one question with its own bot, retrying rate-limit errors with
+    exponential backoff and jitter.
+    """
+    import openai
+
+    travel_bot = TravelAgentBot()
+    attempt = 0
+    started = time.perf_counter()
+    while True:
+        try:
+            with using_session(travel_bot.session_id):
+                response = travel_bot.respond(question)
+            error = None
+            break
+        except openai.RateLimitError as e:
+            if attempt >= max_retries:
+                response, error = None, f"rate limited: {e}"
+                break
+            time.sleep(base_delay * 2 ** attempt * (0.5 + random.random()))
+            attempt += 1
+            # Start the retry from a clean history
+            travel_bot.clear_history()
+        except Exception as e:
+            response, error = None, str(e)
+            break
+    return {
+        "question": question,
+        "response": response,
+        "error": error,
+        "retries": attempt,
+        "latency_s": time.perf_counter() - started,
+    }
+
+
+def run_batch(questions, workers=8, output_path="hard_questions_results.jsonl", max_retries=5):
+    """
+    Runs questions on a worker pool, appending each result to `output_path` as
+    JSONL as soon as it finishes. Returns the results and a latency summary.
+    """
+    results = []
+    started = time.perf_counter()
+    with open(output_path, "w") as output, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(answer_question, question, max_retries) for question in questions]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            status = "error" if result["error"] else "ok"
+            print(f"[{len(results)}/{len(questions)}] {status} {result['latency_s']:.2f}s - {result['question']}")
+    wall_time = time.perf_counter() - started
+
+    summary = summarize_latencies([r["latency_s"] for r in results if not r["error"]], wall_time)
+    summary["errors"] = sum(1 for r in results if r["error"])
+    summary["wall_time_s"] = wall_time
+    return results, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the hard agent questions through the travel agent.")
+    parser.add_argument("--questions", default="generated_questions/test_hard_agent_questions.csv")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--output", default="hard_questions_results.jsonl")
+    parser.add_argument("--parquet", help="Also write the results to this Parquet file")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    import pandas as pd
 
-questions = pd.read_csv("generated_questions/test_hard_agent_questions.csv")
+    questions = pd.read_csv(args.questions)["questions"].tolist()[:args.limit]
+    results, summary = run_batch(questions, workers=args.workers, output_path=args.output, max_retries=args.max_retries)
+    if args.parquet:
+        pd.DataFrame(results).to_parquet(args.parquet, index=False)
 
-# Process each question from the CSV file
-for _, row in questions.iterrows():
-    question = row['questions']
-    print(f"Question: {question}")
-    response = travel_bot.respond(question)
-    travel_bot.clear_history()
\ No newline at end of file
+    print(json.dumps(summary, indent=2))
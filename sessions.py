@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from conversation_store import Conflict
+
+
+def history_size(bot):
+    """Approximate memory footprint of a bot's conversation, in characters."""
+    return sum(len(str(msg.get("content") or "")) for msg in bot.history.get_history())
+
+
+def last_turn(messages):
+    """The messages of the latest turn: its user message and everything after it."""
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i]["role"] == "user":
+            return messages[i:]
+    return []
+
+
+def merge_turn(latest, state):
+    """
+    Resolves a write conflict: the latest stored conversation plus the turn
+    this worker just answered. The newer flight search wins.
+    """
+    return {
+        **latest,
+        "messages": latest["messages"] + last_turn(state["messages"]),
+        "flights": state["flights"] if state["flights"] is not None else latest["flights"],
+    }
+
+
+class SessionStore:
+    """
+    Maps a client session key (e.g. Gradio's session_hash) to its own bot.
+
+    Sessions are kept in least-recently-used order. Sessions idle for longer
+    than `idle_timeout` seconds are dropped, and the least recently used ones
+    are evicted whenever there are more than `max_sessions` or the summed
+    history size exceeds `max_total_chars`. Sizes are updated when a bot is
+    handed out and again when its turn is saved, so a large tool result counts
+    against the budget as soon as the turn that produced it ends.
+
+    With a conversation `store` (see conversation_store.make_store) the bots
+    here are only a cache: get() reloads a conversation whenever another
+    worker has saved a newer version, and save() writes it back after each
+    turn. If another worker saved in the meantime, this worker's latest turn
+    is appended to the stored conversation and the save retried.
+    """
+
+    def __init__(self, factory, max_sessions=1000, idle_timeout=1800, max_total_chars=20_000_000, sizer=history_size,
+                 store=None, max_save_attempts=3):
+        self._factory = factory
+        self.store = store
+        self.max_save_attempts = max_save_attempts
+        self._versions = {}
+        self._sizer = sizer
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_total_chars = max_total_chars
+        self._sessions = OrderedDict()
+        self._sizes = {}
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # Read the shared copy outside the lock; it may be a network round trip
+        stored = self.store.load(key) if self.store is not None else None
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            if key in self._sessions:
+                bot, _ = self._sessions.pop(key)
+            else:
+                bot = self._factory()
+            if stored is not None:
+                state, version = stored
+                if version != self._versions.get(key, 0):
+                    if state is not None:
+                        bot.load_state(state)
+                    self._versions[key] = version
+            self._sessions[key] = (bot, now)
+            self._resize(key, self._sizer(bot))
+            self._evict_over_budget(keep=key)
+            return bot
+
+    def save(self, key, bot):
+        """Records the bot's size after a turn and writes its conversation to the store, if there is one."""
+        try:
+            if self.store is not None:
+                self._write(key, bot)
+        finally:
+            size = self._sizer(bot)
+            with self._lock:
+                # Unless it was evicted (or replaced) while the turn ran
+                if self._sessions.get(key, (None,))[0] is bot:
+                    self._sessions.move_to_end(key)
+                    self._sessions[key] = (bot, time.monotonic())
+                    self._resize(key, size)
+                    self._evict_over_budget(keep=key)
+
+    def _write(self, key, bot):
+        state = bot.to_state()
+        version = self._versions.get(key, 0)
+        for attempt in range(self.max_save_attempts):
+            try:
+                version = self.store.save(key, state, version)
+                break
+            except Conflict:
+                CONVERSATION_CONFLICTS.inc()
+                latest, version = self.store.load(key)
+                if latest is not None:
+                    state = merge_turn(latest, state)
+                    bot.load_state(state)
+                    bot.history.compact()
+                    state = bot.to_state()
+        else:
+            raise Conflict(key)
+        with self._lock:
+            self._versions[key] = version
+
+    def drop(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def total_chars(self):
+        return self._total_chars
+
+    def _resize(self, key, size):
+        self._total_chars += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+
+    def _remove(self, key):
+        self._sessions.pop(key, None)
+        self._versions.pop(key, None)
+        self._total_chars -= self._sizes.pop(key, 0)
+
+    def _evict_idle(self, now):
+        while self._sessions:
+            key, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.idle_timeout:
+                break
+            self._remove(key)
+
+    def _evict_over_budget(self, keep):
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self._total_chars > self.max_total_chars
+        ):
+            key = next(iter(self._sessions))
+            if key == keep:
+                break
+            self._remove(key)
+
+
+CONVERSATION_CONFLICTS = metrics.Counter("travel_agent_conversation_conflicts_total",
+                                         "Conversation saves that lost a race with another worker and were merged.")
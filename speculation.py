@@ -0,0 +1,105 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import tools
+
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "false").lower() == "true"
+SPECULATION_TOKEN_BUDGET = int(os.getenv("SPECULATION_TOKEN_BUDGET", "50000"))
+SPECULATION_BUDGET_WINDOW = float(os.getenv("SPECULATION_BUDGET_WINDOW", "3600"))
+SPECULATION_MAX_IN_FLIGHT = int(os.getenv("SPECULATION_MAX_IN_FLIGHT", "4"))
+SPECULATION_TTL = float(os.getenv("SPECULATION_TTL", "900"))
+
+TRIP_ARGS = ("destination", "checkin_date", "checkout_date")
+
+# tool -> (follow-up tool, arguments it reuses) pairs, most likely first
+FOLLOW_UPS = {
+    "create_itinerary": [("create_packing_list", TRIP_ARGS), ("get_travel_info", ("destination",))],
+    "create_packing_list": [("create_itinerary", TRIP_ARGS), ("get_travel_info", ("destination",))],
+}
+
+
+class TokenBudget:
+    """
+    Allows spending up to `tokens` tokens in any sliding window of `window`
+    seconds.
+    """
+
+    def __init__(self, tokens, window):
+        self.tokens = tokens
+        self.window = window
+        self._spent = deque()
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        with self._lock:
+            cutoff = time.monotonic() - self.window
+            while self._spent and self._spent[0][0] < cutoff:
+                self._spent.popleft()
+            return self.tokens - sum(tokens for _, tokens in self._spent)
+
+    def spend(self, tokens):
+        if tokens:
+            with self._lock:
+                self._spent.append((time.monotonic(), tokens))
+
+
+class Speculator:
+    """
+    After a tool call, computes the likely follow-up LLM tool calls in the
+    background so the next turn finds them in the tool result cache.
+
+    Prefetching stops while `budget` is spent and never runs more than
+    `max_in_flight` calls at once; the cost of a call is only known once it
+    finishes, so the budget can be overshot by the calls already running.
+    Prefetched outputs expire after `ttl` seconds if nobody asks for them.
+    """
+
+    def __init__(self, follow_ups=None, budget=None, max_in_flight=SPECULATION_MAX_IN_FLIGHT, ttl=SPECULATION_TTL):
+        self.follow_ups = FOLLOW_UPS if follow_ups is None else follow_ups
+        self.budget = budget or TokenBudget(SPECULATION_TOKEN_BUDGET, SPECULATION_BUDGET_WINDOW)
+        self.max_in_flight = max_in_flight
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="speculation")
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def after_tool_call(self, tool_name, tool_args):
+        """Schedules prefetches for the follow-ups of a finished tool call. Never blocks."""
+        for follow_up, arg_names in self.follow_ups.get(tool_name, ()):
+            if any(tool_args.get(name) is None for name in arg_names):
+                continue
+            args = {name: tool_args[name] for name in arg_names}
+            key = (follow_up, json.dumps(args, sort_keys=True))
+            with self._lock:
+                if key in self._in_flight:
+                    continue
+                if len(self._in_flight) >= self.max_in_flight:
+                    SPECULATIONS.inc(outcome="busy", tool=follow_up)
+                    continue
+                if self.budget.remaining() <= 0:
+                    SPECULATIONS.inc(outcome="over_budget", tool=follow_up)
+                    continue
+                self._in_flight.add(key)
+            # The prefetch's spans stay in the trace of the call that triggered it
+            self._executor.submit(contextvars.copy_context().run, self._prefetch, key, follow_up, args)
+
+    def _prefetch(self, key, tool_name, args):
+        try:
+            tokens = tools.prefetch_llm_tool(tool_name, args, ttl=self.ttl)
+            self.budget.spend(tokens)
+            SPECULATIONS.inc(outcome="prefetched" if tokens else "already_cached", tool=tool_name)
+        except Exception:
+            SPECULATIONS.inc(outcome="failed", tool=tool_name)
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+
+SPECULATIONS = metrics.Counter("travel_agent_speculations_total",
+                               "Speculative follow-up tool prefetches, by outcome and tool.")
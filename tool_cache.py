@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+
+
+def normalize_arg(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    return value
+
+
+class SemanticIndex:
+    """
+    Local vector index used to match near-duplicate arguments, e.g. "NYC" and
+    "New York City". Texts are only compared within the same scope, so a
+    different prompt version or different dates never match.
+    """
+
+    def __init__(self, embed, threshold=0.92, max_entries_per_scope=1024):
+        self._embed = embed
+        self.threshold = threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self._scopes = {}
+        self._lock = threading.Lock()
+
+    def _vector(self, text):
+        import numpy as np
+
+        vector = np.asarray(self._embed(text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, scope, text):
+        import numpy as np
+
+        with self._lock:
+            entries = list(self._scopes.get(scope, ()))
+        if not entries:
+            return None
+        vector = self._vector(text)
+        similarities = np.stack([v for v, _ in entries]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return entries[best][1]
+        return None
+
+    def add(self, scope, text, key):
+        vector = self._vector(text)
+        with self._lock:
+            entries = self._scopes.setdefault(scope, [])
+            entries.append((vector, key))
+            del entries[:-self.max_entries_per_scope]
+
+
+class ToolResultCache:
+    """
+    Caches LLM tool outputs keyed on the tool name, the prompt version that
+    produced them and the normalized arguments. With a SemanticIndex, a miss
+    on the exact key falls back to a near-duplicate match on `semantic_arg`.
+    """
+
+    def __init__(self, cache, semantic_index=None, semantic_arg="destination"):
+        self.cache = cache
+        self.semantic_index = semantic_index
+        self.semantic_arg = semantic_arg
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prompt_version(prompt):
+        return getattr(prompt, "id", None) or ""
+
+    def key(self, tool_name, prompt, args):
+        normalized = {name: normalize_arg(value) for name, value in args.items()}
+        return json.dumps([tool_name, self._prompt_version(prompt), normalized], sort_keys=True)
+
+    def _semantic_scope(self, tool_name, prompt, args):
+        rest = {name: normalize_arg(value) for name, value in args.items() if name != self.semantic_arg}
+        return json.dumps([tool_name, self._prompt_version(prompt), rest], sort_keys=True)
+
+    def _use_semantic(self, args):
+        return self.semantic_index is not None and isinstance(args.get(self.semantic_arg), str)
+
+    def lookup(self, tool_name, prompt, args):
+        """Returns the cached output for these arguments, or None on a miss."""
+        value = self.cache.get(self.key(tool_name, prompt, args))
+        if value is not None:
+            self._count("hits")
+            return value
+        if self._use_semantic(args):
+            try:
+                similar_key = self.semantic_index.lookup(
+                    self._semantic_scope(tool_name, prompt, args), normalize_arg(args[self.semantic_arg])
+                )
+            except Exception:
+                similar_key = None
+            value = self.cache.get(similar_key) if similar_key else None
+            if value is not None:
+                self._count("semantic_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def contains(self, tool_name, prompt, args):
+        """Whether these exact arguments are cached; unlike lookup, not counted in the stats."""
+        return self.cache.get(self.key(tool_name, prompt, args)) is not None
+
+    def store(self, tool_name, prompt, args, value, ttl=None):
+        if not value:
+            return
+        key = self.key(tool_name, prompt, args)
+        self.cache.set(key, value, ttl=ttl)
+        if self._use_semantic(args):
+            try:
+                self.semantic_index.add(
+                    self._semantic_scope(tool_name, prompt, args), normalize_arg(args[self.semantic_arg]), key
+                )
+            except Exception:
+                pass
+
+    def get_or_compute(self, tool_name, prompt, args, compute):
+        value = self.lookup(tool_name, prompt, args)
+        if value is None:
+            value = compute()
+            self.store(tool_name, prompt, args, value)
+        return value
+
+    async def aget_or_compute(self, tool_name, prompt, args, compute):
+        # Lookups may call the embedding API, so keep them off the event loop.
+        value = await asyncio.to_thread(self.lookup, tool_name, prompt, args)
+        if value is None:
+            value = await compute()
+            await asyncio.to_thread(self.store, tool_name, prompt, args, value)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "name": self.cache.name,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "entries": len(self.cache.backend),
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
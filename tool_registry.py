@@ -0,0 +1,142 @@
+import inspect
+import re
+import typing
+from typing import get_type_hints
+
+import metrics
+
+# name -> callable, name -> async callable, name -> OpenAI tool definition
+TOOLS = {}
+ASYNC_TOOLS = {}
+TOOL_SCHEMAS = {}
+
+_JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+}
+
+_PYTHON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+
+
+def _json_schema(annotation):
+    # Optional[X] / Union[X, None] -> X
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        annotation = args[0] if len(args) == 1 else str
+    schema = {"type": _JSON_TYPES.get(typing.get_origin(annotation) or annotation, "string")}
+    # list[X] -> array of X; OpenAI rejects array parameters without items
+    if schema["type"] == "array":
+        item_args = typing.get_args(annotation)
+        schema["items"] = _json_schema(item_args[0] if item_args else str)
+    return schema
+
+
+def function_to_tool(func):
+    """
+    Converts a Python function with a docstring into an OpenAI-compatible tool definition.
+    """
+    signature = inspect.signature(func)
+    type_hints = get_type_hints(func)
+    params = {}
+    required = []
+
+    for name, param in signature.parameters.items():
+        # Default to str if not annotated
+        params[name] = {
+            **_json_schema(type_hints.get(name, str)),
+            "description": f"{name} parameter"
+        }
+        if param.default is inspect.Parameter.empty:
+            required.append(name)
+
+    # Extract parameter descriptions from docstring if available
+    if func.__doc__:
+        docstring_lines = func.__doc__.strip().split('\n')
+        for i, line in enumerate(docstring_lines):
+            if 'Args:' in line:
+                # Process the parameter descriptions in the docstring, e.g. "origin (str): ..."
+                for j in range(i+1, len(docstring_lines)):
+                    line = docstring_lines[j].strip()
+                    if line and ':' in line:
+                        parts = line.split(':', 1)
+                        param_name = re.sub(r"\s*\(.*\)$", "", parts[0].strip())
+                        if param_name in params:
+                            params[param_name]["description"] = parts[1].strip()
+                    elif not line or 'Returns:' in line:
+                        break
+
+    tool = {
+        "type": "function",
+        "function": {
+            "name": func.__name__,
+            "description": func.__doc__.strip() if func.__doc__ else "No description",
+            "parameters": {
+                "type": "object",
+                "properties": params,
+                "required": required
+            }
+        }
+    }
+
+    return tool
+
+
+def tool(func):
+    """
+    Registers `func` as a router tool and builds its schema once, at import.
+    """
+    TOOLS[func.__name__] = metrics.timed(metrics.TOOL_SECONDS, tool=func.__name__)(func)
+    TOOL_SCHEMAS[func.__name__] = function_to_tool(func)
+    return func
+
+
+def async_tool(name):
+    """
+    Registers the decorated coroutine function as the async implementation of tool `name`.
+    """
+    def register(func):
+        ASYNC_TOOLS[name] = metrics.timed(metrics.TOOL_SECONDS, tool=name)(func)
+        return func
+    return register
+
+
+def validate_tool_args(tool_name, tool_args):
+    """
+    Checks router-supplied arguments against the tool's cached schema. Unknown
+    arguments are dropped; a ValueError is raised for an unknown tool, a missing
+    required argument or a value of the wrong type.
+    """
+    schema = TOOL_SCHEMAS.get(tool_name)
+    if schema is None:
+        raise ValueError(f"Unknown tool: {tool_name}")
+    if not isinstance(tool_args, dict):
+        raise ValueError("Tool arguments must be a JSON object")
+
+    parameters = schema["function"]["parameters"]
+    missing = [name for name in parameters["required"] if tool_args.get(name) is None]
+    if missing:
+        raise ValueError(f"Missing required arguments: {', '.join(missing)}")
+
+    validated = {}
+    for name, value in tool_args.items():
+        if name not in parameters["properties"]:
+            continue
+        expected = parameters["properties"][name]["type"]
+        if value is not None and (
+            not isinstance(value, _PYTHON_TYPES[expected])
+            or (isinstance(value, bool) and expected in ("integer", "number"))
+        ):
+            raise ValueError(f"Argument {name} must be of type {expected}")
+        validated[name] = value
+    return validated
@@ -1,9 +1,99 @@
 
-import openai
-import inspect
-from typing import get_type_hints
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import clients
+import coalesce
+import flights
+import metrics
 import prompts
+from tool_registry import ASYNC_TOOLS, TOOL_SCHEMAS, TOOLS, async_tool, function_to_tool, tool, validate_tool_args
+from cache import ResponseCache, make_backend
+from tool_cache import SemanticIndex, ToolResultCache
+
+flight_cache = ResponseCache(
+    make_backend(os.getenv("FLIGHT_CACHE_PATH"), table="flight_results",
+                 max_entries=int(os.getenv("FLIGHT_CACHE_SIZE", "1024"))),
+    ttl=float(os.getenv("FLIGHT_CACHE_TTL", "600")),
+    stale_ttl=float(os.getenv("FLIGHT_CACHE_STALE_TTL", "1800")),
+    name="flight_search",
+)
+
+MULTI_FLIGHT_MAX_SEARCHES = int(os.getenv("MULTI_FLIGHT_MAX_SEARCHES", "24"))
+MULTI_FLIGHT_CONCURRENCY = int(os.getenv("MULTI_FLIGHT_CONCURRENCY", "4"))
+
+# LLM-backed tools whose prompt variables are exactly the tool arguments
+LLM_TOOL_PROMPTS = {
+    "get_travel_info": "travel-agent-info",
+    "create_itinerary": "travel-agent-itinerary",
+    "create_packing_list": "travel-agent-packing",
+}
+
+def _embed(text):
+    response = clients.openai_client().embeddings.create(model=os.getenv("TOOL_CACHE_EMBEDDING_MODEL", "text-embedding-3-small"), input=text)
+    return response.data[0].embedding
+
+tool_result_cache = ToolResultCache(
+    ResponseCache(
+        make_backend(os.getenv("TOOL_CACHE_PATH"), table="tool_results",
+                     max_entries=int(os.getenv("TOOL_CACHE_SIZE", "512"))),
+        ttl=float(os.getenv("TOOL_CACHE_TTL", "86400")),
+        name="llm_tools",
+    ),
+    semantic_index=SemanticIndex(_embed, threshold=float(os.getenv("TOOL_CACHE_SIMILARITY", "0.92")))
+    if os.getenv("TOOL_CACHE_SEMANTIC", "false").lower() == "true" else None,
+)
+
+def _run_llm_tool(tool_name, variables):
+    prompt = prompts.get_prompt(LLM_TOOL_PROMPTS[tool_name])
+    
+    def generate():
+        response = clients.openai_client().chat.completions.create(**prompt.format(variables=variables))
+        metrics.record_tokens(tool_name, response.usage)
+        return response.choices[0].message.content
+    
+    return tool_result_cache.get_or_compute(tool_name, prompt, variables, generate)
+
+async def _run_llm_tool_async(tool_name, variables):
+    prompt = await prompts.get_prompt_async(LLM_TOOL_PROMPTS[tool_name])
+    
+    async def generate():
+        response = await clients.async_openai_client().chat.completions.create(**prompt.format(variables=variables))
+        metrics.record_tokens(tool_name, response.usage)
+        return response.choices[0].message.content
+    
+    return await tool_result_cache.aget_or_compute(tool_name, prompt, variables, generate)
+
+def prefetch_llm_tool(tool_name, variables, ttl=None):
+    """
+    Computes an LLM tool's output into the tool result cache before anyone asks
+    for it, expiring after `ttl` seconds if unused. Returns the tokens spent,
+    0 when the output was already cached.
+    """
+    prompt = prompts.get_prompt(LLM_TOOL_PROMPTS[tool_name])
+    if tool_result_cache.contains(tool_name, prompt, variables):
+        return 0
+    response = clients.openai_client().chat.completions.create(**prompt.format(variables=variables))
+    metrics.record_tokens(tool_name, response.usage)
+    tool_result_cache.store(tool_name, prompt, variables, response.choices[0].message.content, ttl=ttl)
+    return response.usage.total_tokens if response.usage else 0
+
+metrics.register_cache(flight_cache)
+metrics.register_cache(tool_result_cache)
+
+def flight_cache_key(origin, destination, departure_date, return_date, trip_type):
+    return "|".join([
+        str(origin or "").strip().upper(),
+        str(destination or "").strip().upper(),
+        str(departure_date or "").strip(),
+        str(return_date or "").strip(),
+        str(trip_type),
+    ])
 
+@tool
 def get_travel_info(destination):
     """
     Retrieves travel information for a specified destination using OpenAI's API.
@@ -14,17 +104,50 @@ def get_travel_info(destination):
     Returns:
         str: Travel information including highlights and key details about the destination
     """
-    # Call OpenAI API for travel information
-    info_prompt = prompts.get_prompt("travel-agent-info")
-    response = openai.chat.completions.create(
-        **info_prompt.format(variables={"destination": destination})
-    )
+    # Call OpenAI API for travel information, unless an equivalent answer is cached
+    return _run_llm_tool("get_travel_info", {"destination": destination})
+
+def _search_flights(origin, destination, departure_date, return_date=None):
+    """
+    Compact results ({"flights": rows} or {"error": ...}) of one flight search,
+    served from the flight cache when possible.
+    """
+    params = {
+        "engine": "google_flights",
+        "hl": "en", 
+        "departure_id": origin,
+        "arrival_id": destination,
+        "outbound_date": departure_date,
+        "return_date": return_date,
+        "stops": 2,
+        "currency": "USD",
+        "api_key": os.getenv("SERPER_API_KEY")
+    }
+
+    if return_date:
+        params["type"] = "1"  # Round Trip
+    else:
+        params["type"] = "2"  # One Way
+
+    # Popular routes are served from the cache instead of re-querying SerpAPI;
+    # only the compact parsed rows are kept, not the raw response
+    key = flight_cache_key(origin, destination, departure_date, return_date, params["type"])
+    
+    def search():
+        return flight_cache.get_or_compute(
+            key,
+            lambda: flights.parse_serpapi(clients.serpapi_search(params)),
+            should_cache=lambda results: "error" not in results,
+        )
     
-    # Extract the response text
-    travel_info = response.choices[0].message.content
-    return travel_info
+    timeout = coalesce.COALESCE_TIMEOUTS.get("flight_search")
+    if timeout is None:
+        return search()
+    # Identical searches already in flight, from any conversation, share one SerpAPI call
+    return coalesce.flight_searches.do(key, search, timeout=timeout, label="flight_search")
 
-def flight_search(origin, destination, departure_date, return_date):
+@tool
+def flight_search(origin, destination, departure_date, return_date=None):
     """
     Searches for available flights between two locations using the Google Flights API via SerpAPI.
     
@@ -38,81 +161,105 @@ def flight_search(origin, destination, departure_date, return_date):
         str: Formatted string containing flight details including times, prices and layovers
     """
     try:
-        from serpapi import GoogleSearch
-        import os
-        
-        SERPER_API_KEY = os.getenv("SERPER_API_KEY")
-        
-        def format_minutes(total_minutes):
-            if not isinstance(total_minutes, int) or total_minutes < 0:
-                raise ValueError("Total minutes must be a non-negative integer.")
-            hours = total_minutes // 60
-            minutes = total_minutes % 60
-            if hours > 0 and minutes > 0:
-                return f"{hours} hr {minutes} min"
-            elif hours > 0:
-                return f"{hours} hr"
-            else:
-                return f"{minutes} min"
-
-        def format_one_flight(flight_no, dep_port, arr_port, dep_time, arr_time, duration, airline, airplane):
-            return f"{airline} {flight_no} - {dep_port} ({dep_time}) -> {arr_port} ({arr_time}) [{format_minutes(duration)}] - {airplane}"
-
-        def get_formatted_flights_info(flights):
-            formatted_flights = []
-            for flight in flights:
-                for part in flight["flights"]:
-                    formatted_flights.append(
-                        format_one_flight(
-                            part["flight_number"],
-                            part["departure_airport"]["id"], 
-                            part["arrival_airport"]["id"],
-                            part["departure_airport"]["time"],
-                            part["arrival_airport"]["time"],
-                            part["duration"],
-                            part["airline"],
-                            part["airplane"]
-                        )
-                    )
-                if "layovers" in flight and len(flight["layovers"]) > 0:
-                    formatted_flights.append(
-                        f"Layover at {flight['layovers'][0]['id']}: {format_minutes(flight['layovers'][0]['duration'])}"
-                    )
-                formatted_flights.append(f"Total Duration: {format_minutes(flight['total_duration'])}")
-                formatted_flights.append(f"Price (USD): ${flight['price']}")
-                formatted_flights.append("")
-            return "\n".join(formatted_flights)
-
-        params = {
-            "engine": "google_flights",
-            "hl": "en", 
-            "departure_id": origin,
-            "arrival_id": destination,
-            "outbound_date": departure_date,
-            "return_date": return_date,
-            "stops": 2,
-            "currency": "USD",
-            "api_key": SERPER_API_KEY
-        }
-
-        if return_date:
-            params["type"] = "1"  # Round Trip
-        else:
-            params["type"] = "2"  # One Way
-
-        search = GoogleSearch(params)
-        results = search.get_dict()
+        results = _search_flights(origin, destination, departure_date, return_date)
         
         if "error" in results:
             return f"Error searching flights: {results['error']}"
-            
-        flights_data = results.get("best_flights", [])
-        first_line = f"Flights from {origin} to {destination}:"
-        return first_line + "\n\n" + get_formatted_flights_info(flights_data[:3])
+        
+        # Kept for refine_flights, so follow-ups filter locally instead of searching again
+        found = flights.FlightResults.from_rows(origin, destination, departure_date, return_date, results["flights"])
+        flights.remember(found)
+        return found.format(limit=3)
         
     except Exception as e:
         return f"Failed to search flights: {str(e)}"
 
+@tool
+def multi_flight_search(origins: list[str], destinations: list[str], earliest_departure_date: str,
+                        latest_departure_date: Optional[str] = None, trip_length_days: Optional[int] = None,
+                        departure_weekdays: Optional[list[str]] = None, limit: int = 5):
+    """
+    Searches flights for several routes and/or a range of departure dates at once and returns
+    the cheapest options across all of them. Use it for flexible requests such as "cheapest
+    weekend in June from SFO to any of LIS, BCN or FCO" instead of calling flight_search repeatedly.
+    
+    Args:
+        origins (list): Departure airport codes
+        destinations (list): Arrival airport codes
+        earliest_departure_date (str): First possible outbound date in YYYY-MM-DD format
+        latest_departure_date (str): Last possible outbound date in YYYY-MM-DD format, optional for a single date
+        trip_length_days (int): Days between departure and return, optional for one-way flights
+        departure_weekdays (list): Only depart on these weekdays, e.g. ["Friday"], optional
+        limit (int): How many flights to show
+        
+    Returns:
+        str: Formatted string containing the cheapest flights across all searches
+    """
+    try:
+        searches = flights.plan_searches(origins, destinations, earliest_departure_date, latest_departure_date,
+                                         trip_length_days, departure_weekdays)
+    except ValueError as e:
+        return f"Failed to search flights: {e}"
+    if not searches:
+        return "No departure dates match those criteria."
+    if len(searches) > MULTI_FLIGHT_MAX_SEARCHES:
+        return (f"That would take {len(searches)} flight searches; narrow the routes or dates to at most "
+                f"{MULTI_FLIGHT_MAX_SEARCHES} combinations.")
+    
+    # Cached searches return at once; the rest share the SerpAPI rate limiter
+    executor = ThreadPoolExecutor(max_workers=min(MULTI_FLIGHT_CONCURRENCY, len(searches)))
+    with executor:
+        futures = [executor.submit(contextvars.copy_context().run, _search_flights, *search) for search in searches]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append({"error": str(e)})
+    
+    found = [flights.FlightResults.from_rows(*search, outcome["flights"])
+             for search, outcome in zip(searches, outcomes) if "error" not in outcome]
+    errors = [outcome["error"] for outcome in outcomes if "error" in outcome]
+    if not found:
+        return f"Error searching flights: {errors[0]}"
+    
+    merged = flights.merge(found)
+    flights.remember(merged)
+    text = merged.format(limit=max(1, limit))
+    if errors:
+        text += f"\n{len(errors)} of {len(searches)} searches failed, so cheaper options may be missing."
+    return text
+
+@tool
+def refine_flights(sort_by: str = "price", max_price: Optional[int] = None, max_stops: Optional[int] = None,
+                   max_duration_minutes: Optional[int] = None, airline: Optional[str] = None, limit: int = 3):
+    """
+    Filters and re-sorts the flights found by the most recent flight search in this conversation,
+    without searching again. Use it for follow-ups like "anything cheaper?", "only nonstop flights"
+    or "the shortest one".
+    
+    Args:
+        sort_by (str): One of price, duration, stops or departure
+        max_price (int): Highest price in USD to keep, optional
+        max_stops (int): Most stops to keep (0 for nonstop), optional
+        max_duration_minutes (int): Longest total duration in minutes to keep, optional
+        airline (str): Only keep flights on this airline, optional
+        limit (int): How many flights to show
+        
+    Returns:
+        str: Formatted string containing the matching flights
+    """
+    results = flights.latest()
+    if results is None:
+        return "There are no flight search results to refine yet. Search for flights first."
+    try:
+        refined = results.refine(sort_by=sort_by, max_price=max_price, max_stops=max_stops,
+                                 max_duration=max_duration_minutes, airline=airline)
+    except ValueError as e:
+        return f"Failed to refine flights: {e}"
+    return refined.format(limit=max(1, limit))
+
+@tool
 def create_itinerary(destination, checkin_date, checkout_date):
     """
     Creates a travel itinerary for a destination between specified dates.
@@ -125,14 +272,11 @@ def create_itinerary(destination, checkin_date, checkout_date):
     Returns:
         str: Generated itinerary for the trip
     """
-    itinerary_prompt = prompts.get_prompt("travel-agent-itinerary")
-    response = openai.chat.completions.create(
-        **itinerary_prompt.format(variables={"destination": destination, 
-                                             "checkin_date": checkin_date, 
-                                             "checkout_date": checkout_date})
-    )
-    return response.choices[0].message.content
+    return _run_llm_tool("create_itinerary", {"destination": destination, 
+                                              "checkin_date": checkin_date, 
+                                              "checkout_date": checkout_date})
 
+@tool
 def create_packing_list(destination, checkin_date, checkout_date):
     """
     Generates a packing list for a trip based on destination and dates.
@@ -145,76 +289,87 @@ def create_packing_list(destination, checkin_date, checkout_date):
     Returns:
         str: Customized packing list for the trip
     """
-    packing_prompt = prompts.get_prompt("travel-agent-packing")
-    response = openai.chat.completions.create(
-        **packing_prompt.format(variables={"destination": destination, 
-                                             "checkin_date": checkin_date, 
-                                             "checkout_date": checkout_date})
-    )
-    return response.choices[0].message.content
+    return _run_llm_tool("create_packing_list", {"destination": destination, 
+                                                 "checkin_date": checkin_date, 
+                                                 "checkout_date": checkout_date})
+
+@async_tool("get_travel_info")
+async def get_travel_info_async(destination):
+    """
+    Async variant of get_travel_info.
+    """
+    return await _run_llm_tool_async("get_travel_info", {"destination": destination})
+
+@async_tool("flight_search")
+async def flight_search_async(origin, destination, departure_date, return_date=None):
+    """
+    Async variant of flight_search. The flight cache and search are synchronous, so they run on a worker thread.
+    """
+    return await asyncio.to_thread(flight_search, origin, destination, departure_date, return_date)
 
-def function_to_tool(func):
+@async_tool("multi_flight_search")
+async def multi_flight_search_async(origins, destinations, earliest_departure_date, latest_departure_date=None,
+                                    trip_length_days=None, departure_weekdays=None, limit=5):
+    """
+    Async variant of multi_flight_search. The searches fan out on their own thread pool.
+    """
+    return await asyncio.to_thread(multi_flight_search, origins, destinations, earliest_departure_date,
+                                   latest_departure_date, trip_length_days, departure_weekdays, limit)
+
+@async_tool("refine_flights")
+async def refine_flights_async(sort_by="price", max_price=None, max_stops=None,
+                               max_duration_minutes=None, airline=None, limit=3):
+    """
+    Async variant of refine_flights. Refining is local and quick, so it runs inline.
     """
-    Converts a Python function with a docstring into an OpenAI-compatible tool definition.
+    return refine_flights(sort_by, max_price, max_stops, max_duration_minutes, airline, limit)
+
+@async_tool("create_itinerary")
+async def create_itinerary_async(destination, checkin_date, checkout_date):
+    """
+    Async variant of create_itinerary.
+    """
+    return await _run_llm_tool_async("create_itinerary", {"destination": destination, 
+                                                          "checkin_date": checkin_date, 
+                                                          "checkout_date": checkout_date})
+
+@async_tool("create_packing_list")
+async def create_packing_list_async(destination, checkin_date, checkout_date):
     """
-    signature = inspect.signature(func)
-    params = {}
+    Async variant of create_packing_list.
+    """
+    return await _run_llm_tool_async("create_packing_list", {"destination": destination, 
+                                                             "checkin_date": checkin_date, 
+                                                             "checkout_date": checkout_date})
+
+async def stream_tool_async(tool_name, tool_args):
+    """
+    Runs a tool and yields its output in chunks. LLM-backed tools yield tokens as they
+    arrive; other tools and cached results yield their whole result once.
+    """
+    if tool_name not in LLM_TOOL_PROMPTS:
+        yield await ASYNC_TOOLS[tool_name](**tool_args)
+        return
     
-    for name, param in signature.parameters.items():
-        param_type = get_type_hints(func).get(name, str)  # Default to str if not annotated
-        param_type_str = param_type.__name__ if hasattr(param_type, "__name__") else "string"
+    # ASYNC_TOOLS[...] times the other tools; streamed LLM tools are timed here
+    with metrics.timed(metrics.TOOL_SECONDS, tool=tool_name):
+        prompt = await prompts.get_prompt_async(LLM_TOOL_PROMPTS[tool_name])
+        cached = await asyncio.to_thread(tool_result_cache.lookup, tool_name, prompt, tool_args)
+        if cached is not None:
+            yield cached
+            return
         
-        # Convert Python types to JSON Schema types
-        if param_type_str == "str":
-            param_type_str = "string"
-        elif param_type_str == "int":
-            param_type_str = "integer"
-        elif param_type_str == "float":
-            param_type_str = "number"
-        elif param_type_str == "bool":
-            param_type_str = "boolean"
-        
-        params[name] = {
-            "type": param_type_str,
-            "description": f"{name} parameter"
-        }
-
-    # Extract parameter descriptions from docstring if available
-    if func.__doc__:
-        docstring_lines = func.__doc__.strip().split('\n')
-        for i, line in enumerate(docstring_lines):
-            if 'Args:' in line:
-                # Process the parameter descriptions in the docstring
-                for j in range(i+1, len(docstring_lines)):
-                    line = docstring_lines[j].strip()
-                    if line and ':' in line:
-                        parts = line.split(':', 1)
-                        param_name = parts[0].strip()
-                        if param_name in params:
-                            params[param_name]["description"] = parts[1].strip()
-                    elif not line or 'Returns:' in line:
-                        break
-
-    tool = {
-        "type": "function",
-        "function": {
-            "name": func.__name__,
-            "description": func.__doc__.strip() if func.__doc__ else "No description",
-            "parameters": {
-                "type": "object",
-                "properties": params,
-                "required": list(params.keys())
-            }
-        }
-    }
-    
-    return tool
-
+        parts = []
+        stream = await clients.async_openai_client().chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **prompt.format(variables=tool_args)
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                metrics.record_tokens(tool_name, chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        await asyncio.to_thread(tool_result_cache.store, tool_name, prompt, tool_args, "".join(parts))
 
 def get_tools():
-    return [
-        function_to_tool(get_travel_info),
-        function_to_tool(flight_search),
-        function_to_tool(create_itinerary),
-        function_to_tool(create_packing_list)
-    ]
\ No newline at end of file
+    return list(TOOL_SCHEMAS.values())
@@ -0,0 +1,70 @@
+import functools
+import inspect
+import threading
+
+
+class LazyTracer:
+    """
+    Stands in for the tracer returned by instrument.setup_tracing, which
+    imports OpenTelemetry and OpenInference and instruments the OpenAI SDK.
+    That only happens on the first traced call (or setup()), so importing the
+    bot stays cheap for scripts and workers that start up often.
+
+    `chain`, `tool` and `agent` decorate like the tracer's own decorators;
+    everything else is forwarded to the real tracer.
+    """
+
+    def __init__(self, **setup_kwargs):
+        self._setup_kwargs = setup_kwargs
+        self._tracer = None
+        self._lock = threading.Lock()
+
+    def setup(self):
+        if self._tracer is None:
+            with self._lock:
+                if self._tracer is None:
+                    from instrument import setup_tracing
+
+                    self._tracer = setup_tracing(**self._setup_kwargs)
+        return self._tracer
+
+    def __getattr__(self, name):
+        return getattr(self.setup(), name)
+
+    def _decorator(self, kind, *args, **kwargs):
+        def decorate(fn):
+            traced = None
+
+            def resolve():
+                nonlocal traced
+                if traced is None:
+                    traced = getattr(self.setup(), kind)(*args, **kwargs)(fn)
+                return traced
+
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*call_args, **call_kwargs):
+                    return await resolve()(*call_args, **call_kwargs)
+            else:
+                @functools.wraps(fn)
+                def wrapper(*call_args, **call_kwargs):
+                    return resolve()(*call_args, **call_kwargs)
+            return wrapper
+
+        return decorate
+
+    def chain(self, *args, **kwargs):
+        return self._decorator("chain", *args, **kwargs)
+
+    def tool(self, *args, **kwargs):
+        return self._decorator("tool", *args, **kwargs)
+
+    def agent(self, *args, **kwargs):
+        return self._decorator("agent", *args, **kwargs)
+
+
+def using_session(session_id):
+    """openinference's using_session, imported on first use."""
+    from openinference.instrumentation import using_session
+
+    return using_session(session_id)